@@ -1,8 +1,17 @@
 import streamlit as st
+import time
 from datetime import datetime, timedelta
-from scrapers.reddit_scraper import search_reddit_posts
-from core.text_processor import process_and_store_texts, get_similar_chunks, create_vector_store, create_conversation_chain, duckduckgo_search
-from core.trend_core import get_cache_key, get_cached_results, cache_results, generate_wordcloud, format_key_insights
+from core.text_processor import (create_conversation_chain, answer_question, standalone_question, CHAT_MEMORY_MODES,
+                                 RETRIEVAL_MODES)
+from core.trend_core import generate_wordcloud, format_key_insights, WORDCLOUD_PARAMS
+from core.trend_signals import build_term_signals_from_store
+from core.analysis import get_analysis_key, run_analysis
+from core.jobs import get_job_manager, DONE, FAILED
+from core.cache_store import get_cache_store
+from core.embedding_backends import EMBEDDING_BACKENDS, DEFAULT_EMBEDDING_BACKEND
+from core import metrics
+from core.answer_cache import corpus_fingerprint, get_answer_cache
+from scrapers.reddit_scraper import DEFAULT_SUBREDDITS, DEFAULT_SORTS, SORT_OPTIONS, parse_subreddits, parse_sort
 
 from pathlib import Path
 
@@ -106,10 +115,26 @@ if "conversation_chain" not in st.session_state:
 
 CACHE_DIR = Path("data/.cache")
 CACHE_DIR.mkdir(exist_ok=True)
+JOB_POLL_INTERVAL = 1.0
 
-print("Streamlit script started")
-print("Analysis done:", st.session_state.analysis_done)
-print("Chat input value:", st.session_state.get("chat_input", None))
+def turn_details(message):
+    if message.get("cached"):
+        details = "answered from cache"
+    elif message.get("prompt_tokens"):
+        details = f"prompt {message['prompt_tokens']:,} tokens, history {message.get('history_tokens', 0):,}"
+        retrieval = message.get("retrieval") or {}
+        paths = [f"{path} {retrieval[f'{path}_ms']:.1f} ms" for path in ("keyword", "dense") if f"{path}_ms" in retrieval]
+        if paths:
+            details += f", retrieval {', '.join(paths)}"
+    else:
+        return ""
+    return f'<br><span style="font-size:0.75em; opacity:0.6;">{details}</span>'
+
+metrics.log_event(
+    "script_run",
+    analysis_done=st.session_state.analysis_done,
+    chat_input_chars=len(st.session_state.get("chat_input") or "")
+)
 
 with st.sidebar:
     st.title("📊 Trend Analyzer")
@@ -127,6 +152,46 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("### Settings")
     cache_enabled = st.checkbox("Enable Caching", value=True)
+    cache_stats = get_cache_store().stats()
+    st.caption(f"Cache: {cache_stats['entries']} entries, {cache_stats['bytes'] / 2**20:.1f} MB "
+               f"of {cache_stats['max_bytes'] / 2**20:.0f} MB, hit rate {cache_stats['hit_rate']:.0%}")
+    date_bounded = st.checkbox("Newest posts in date range only", value=True)
+    subreddits = parse_subreddits(st.text_input(
+        "Subreddits",
+        value=",".join(DEFAULT_SUBREDDITS),
+        help="Comma-separated; searched together."
+    ))
+    sorts = tuple(parse_sort(sort) for sort in st.multiselect(
+        "Listings",
+        SORT_OPTIONS,
+        default=[f"{sort}:{time_filter}" for sort, time_filter in DEFAULT_SORTS],
+        disabled=date_bounded,
+        help="Sort orders searched in parallel when not limited to the newest posts."
+    )) or DEFAULT_SORTS
+    embedding_backend = st.selectbox(
+        "Embedding backend",
+        list(EMBEDDING_BACKENDS),
+        index=list(EMBEDDING_BACKENDS).index(DEFAULT_EMBEDDING_BACKEND),
+        help="'local' embeds offline with a hashing TF-IDF model; no embedding API calls."
+    )
+    chat_memory_mode = st.selectbox(
+        "Chat memory",
+        CHAT_MEMORY_MODES,
+        help="'rolling' keeps the last few turns plus a summary of older ones, so long chats stay fast; "
+             "'buffer' resends the full history every turn."
+    )
+    retrieval_mode = st.selectbox(
+        "Retrieval",
+        RETRIEVAL_MODES,
+        help="'hybrid' fuses keyword (BM25) and embedding matches; 'keyword' answers exact terms "
+             "without embedding the question; 'dense' uses embeddings only."
+    )
+    st.download_button(
+        "Download metrics (Prometheus)",
+        metrics.prometheus_text(),
+        file_name="trend_analyzer_metrics.prom",
+        mime="text/plain"
+    )
     st.markdown("---")
     st.markdown("Made with ❤️ using Streamlit and LangChain")
 
@@ -158,59 +223,111 @@ if analyze_button:
     if not topic:
         st.warning("Please enter a topic or keyword to analyze.")
     else:
-        with st.spinner("Analyzing trends... This may take a few moments."):
-            cache_key = get_cache_key(topic, source, start_date, end_date)
-            cached_results = get_cached_results(cache_key) if cache_enabled else None
-            
-            if cached_results:
+        job_key = get_analysis_key(topic, source, start_date, end_date, date_bounded, embedding_backend,
+                                   subreddits, sorts)
+        job = get_job_manager().submit(
+            job_key,
+            lambda job: run_analysis(topic, source, start_date, end_date, cache_enabled, date_bounded, job=job,
+                                     embedding_backend=embedding_backend, subreddits=subreddits, sorts=sorts),
+            description=f"{topic} ({start_date} to {end_date})"
+        )
+        st.session_state.analysis_job_id = job.id
+
+job_id = st.session_state.get("analysis_job_id")
+if job_id:
+    job = get_job_manager().get(job_id)
+    if job is None:
+        st.session_state.analysis_job_id = None
+    elif not job.finished:
+        st.progress(job.progress, text=job.message or "Analyzing trends... This may take a few moments.")
+        if st.button("Cancel analysis"):
+            get_job_manager().cancel(job.id)
+            st.session_state.analysis_job_id = None
+            st.rerun()
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
+    else:
+        st.session_state.analysis_job_id = None
+        if job.status == DONE:
+            result = job.result
+            if result["from_cache"]:
                 st.info("Using cached results...")
-                vector_store, key_insights, conversation_chain = cached_results
-                st.session_state.conversation_chain = conversation_chain or create_conversation_chain(vector_store)
-            else:
-                content = search_reddit_posts(topic, start_date=start_date, end_date=end_date)
-                source_name = "Reddit"
-                if not content:
-                    st.error("No content found or an error occurred while searching.")
-                    st.session_state.analysis_done = False
-                    st.session_state.conversation_chain = None
-                else:
-                    st.success(f"Found {len(content)} items from {source_name}!")
-                    with st.spinner("Processing content and generating insights..."):
-                        metadata = {
-                            "source": source_name,
-                            "topic": topic,
-                            "date_range": f"{start_date} to {end_date}"
-                        }
-                        vector_store, key_insights, conversation_chain, insight_sources = process_and_store_texts(content, metadata)
-                        if cache_enabled:
-                            cache_results(cache_key, vector_store, key_insights, conversation_chain)
-            st.session_state.key_insights = key_insights
-            st.session_state.insight_sources = insight_sources
-            st.session_state.similar_chunks = [chunk.page_content for chunk in get_similar_chunks(vector_store, topic)[:5]]
-            st.session_state.vector_store = vector_store
-            conversation_chain = create_conversation_chain(vector_store)
-            st.session_state.conversation_chain = conversation_chain
+            st.session_state.key_insights = result["key_insights"]
+            st.session_state.insight_sources = result["insight_sources"]
+            st.session_state.similar_chunks = result["similar_chunks"]
+            st.session_state.analysis_stats = result["stats"]
+            st.session_state.analysis_timings = result["timings"]
+            st.session_state.render_timings = None
+            st.session_state.vector_store = result["vector_store"]
+            st.session_state.corpus_id = corpus_fingerprint(result["vector_store"])
+            st.session_state.wordcloud_img = None
+            st.session_state.term_signals = result["term_signals"]
+            st.session_state.conversation_chain = create_conversation_chain(
+                result["vector_store"], chat_memory_mode, retrieval_mode
+            )
             st.session_state.analysis_done = True
             st.rerun()
+        elif job.status == FAILED:
+            st.error(job.error)
+            st.session_state.analysis_done = False
+            st.session_state.conversation_chain = None
+        else:
+            st.warning("Analysis cancelled.")
 
 if st.session_state.analysis_done:
     st.subheader("Analysis Results")
+    dedup_stats = st.session_state.get("analysis_stats", {}).get("dedup")
+    if dedup_stats and dedup_stats["duplicates"]:
+        st.caption(f"Merged {dedup_stats['duplicates']} near-duplicate posts into their originals "
+                   f"({dedup_stats['duplicate_ratio']:.0%} of {dedup_stats['input']}, {dedup_stats['seconds']:.2f}s).")
+    timings = st.session_state.get("analysis_timings")
+    if timings:
+        with st.expander(f"Timing breakdown ({timings['total_seconds']:.1f}s)", expanded=False):
+            stages = list(timings["stages"])
+            render_timings = st.session_state.get("render_timings")
+            if render_timings:
+                stages += render_timings["stages"]
+            st.caption("Fetching, embedding and indexing overlap, so stage times can add up to more than the total.")
+            st.table([
+                {"Stage": stage["stage"], "Seconds": f"{stage['seconds']:.2f}", "Calls": stage["count"]}
+                for stage in stages
+            ])
+            if timings["counters"]:
+                st.table([{"Counter": key, "Value": f"{value:g}"} for key, value in timings["counters"].items()])
     with st.expander("Summary", expanded=True):
         st.markdown("### Word Cloud Analysis")
         vector_store = st.session_state.get("vector_store", None)
         if vector_store is not None:
             try:
-                docs = vector_store.similarity_search("", k=1000)
-                if docs:
-                    all_content = " ".join([doc.page_content for doc in docs])
-                    wordcloud_img = generate_wordcloud(all_content)
-                    st.markdown(f'<div style="text-align: center;"><img src="data:image/png;base64,{wordcloud_img}" alt="Word Cloud"></div>', unsafe_allow_html=True)
+                if st.session_state.get("wordcloud_img") is None:
+                    with metrics.trace("render") as render_trace:
+                        if st.session_state.get("term_signals") is None:
+                            with metrics.span("term_signals"):
+                                st.session_state.term_signals = build_term_signals_from_store(vector_store)
+                        frequencies = st.session_state.term_signals.frequencies(WORDCLOUD_PARAMS["max_words"])
+                        st.session_state.wordcloud_img = generate_wordcloud(frequencies) if frequencies else None
+                    st.session_state.render_timings = render_trace.summary()
+                wordcloud_img = st.session_state.wordcloud_img
+                if wordcloud_img:
+                    st.markdown(f'<div style="text-align: center;"><img src="data:image/png;base64,{wordcloud_img}" alt="Word Cloud" style="max-width: 100%;"></div>', unsafe_allow_html=True)
                 else:
                     st.warning("No content available for word cloud generation.")
             except Exception as e:
                 st.error(f"Error generating word cloud: {str(e)}")
         else:
             st.warning("No analysis results available. Please run an analysis first.")
+        term_signals = st.session_state.get("term_signals")
+        if term_signals is not None:
+            bursts = term_signals.top_bursts()
+            if bursts:
+                st.markdown(f"### Trending Terms ({bursts[0]['day']})")
+                st.markdown(
+                    '<ul>' + ''.join(
+                        f"<li><strong>{burst['term']}</strong> — {burst['count']} mentions, z={burst['z']:.1f}</li>"
+                        for burst in bursts
+                    ) + '</ul>',
+                    unsafe_allow_html=True
+                )
         st.markdown("### Key Insights")
         key_insights = st.session_state.get("key_insights", [])
         insight_sources = st.session_state.get("insight_sources", [])
@@ -266,7 +383,7 @@ if st.session_state.analysis_done:
                             box-shadow: 0 2px 8px rgba(0,0,0,0.04);
                         ">
                             <span style="font-size:0.9em; opacity:0.7;">Assistant</span><br>
-                            {history[i+1]['content']}
+                            {history[i+1]['content']}{turn_details(history[i+1])}
                         </div>
                     """, unsafe_allow_html=True)
                     i += 2
@@ -291,7 +408,7 @@ if st.session_state.analysis_done:
                         box-shadow: 0 2px 8px rgba(0,0,0,0.04);
                     ">
                         <span style="font-size:0.9em; opacity:0.7;">Assistant</span><br>
-                        {history[i]['content']}
+                        {history[i]['content']}{turn_details(history[i])}
                     </div>
                 """, unsafe_allow_html=True)
                 i += 1
@@ -302,39 +419,56 @@ if st.session_state.analysis_done:
             if submitted and user_question:
                 st.session_state.chat_history.append({"role": "user", "content": user_question})
                 if st.session_state.conversation_chain:
-                    with st.spinner("Thinking..."):
-                        response = st.session_state.conversation_chain({"question": user_question})
-                        source_docs = response.get("source_documents", [])
-                        sources_info = []
-                        for doc in source_docs:
-                            source_info = {
-                                "source": doc.metadata.get("source", "Unknown"),
-                                "username": doc.metadata.get("username", ""),
-                                "timestamp": doc.metadata.get("timestamp", ""),
-                                "content": doc.page_content,
-                                "index": doc.metadata.get("source_index", 0)
-                            }
-                            sources_info.append(source_info)
-                        assistant_answer = response["answer"].strip().lower()
-                        uncertainty_phrases = [
-                            "i don't know",
-                            "not sure",
-                            "don't have enough information",
-                            "cannot answer",
-                            "unable to find",
-                            "no information available"
-                        ]
-                        if any(phrase in assistant_answer for phrase in uncertainty_phrases):
-                            with st.spinner("Searching the web for more information..."):
-                                web_answer = duckduckgo_search(user_question)
-                                final_answer = f"Based on web search:\n\n{web_answer}"
-                        else:
-                            final_answer = response["answer"]
+                    vector_store = st.session_state.get("vector_store")
+                    answer_cache = None
+                    cache_question = None
+                    if vector_store is not None and st.session_state.get("corpus_id"):
+                        answer_cache = get_answer_cache(st.session_state.corpus_id, vector_store.embeddings)
+                        # Follow-ups are cached under their standalone form.
+                        cache_question = standalone_question(st.session_state.conversation_chain, user_question)
+                    cached_answer = answer_cache.lookup(cache_question) if cache_question else None
+                    if cached_answer:
+                        # Keep the chain's memory in step so follow-up questions still see this turn.
+                        st.session_state.conversation_chain.memory.save_context(
+                            {"question": user_question}, {"answer": cached_answer["answer"]}
+                        )
                         st.session_state.chat_history.append({
                             "role": "assistant",
-                            "content": final_answer,
-                            "sources": sources_info
+                            "content": cached_answer["answer"],
+                            "sources": cached_answer["sources"],
+                            "cached": True
                         })
+                    else:
+                        with st.spinner("Thinking..."):
+                            with metrics.span("chat"):
+                                answer = answer_question(
+                                    st.session_state.conversation_chain, vector_store, user_question
+                                )
+                            response = answer["response"]
+                            memory = st.session_state.conversation_chain.memory
+                            source_docs = response.get("source_documents", [])
+                            sources_info = []
+                            for doc in source_docs:
+                                source_info = {
+                                    "source": doc.metadata.get("source", "Unknown"),
+                                    "username": doc.metadata.get("username", ""),
+                                    "timestamp": doc.metadata.get("timestamp", ""),
+                                    "content": doc.page_content,
+                                    "index": doc.metadata.get("source_index", 0)
+                                }
+                                sources_info.append(source_info)
+                            final_answer = answer["answer"]
+                            if cache_question:
+                                answer_cache.store(cache_question, final_answer, sources_info)
+                            st.session_state.chat_history.append({
+                                "role": "assistant",
+                                "content": final_answer,
+                                "sources": sources_info,
+                                "prompt_tokens": answer["prompt_tokens"],
+                                "history_tokens": getattr(memory, "last_history_tokens", 0),
+                                "retrieval": answer["retrieval"]
+                            })
+                            metrics.increment("chat_prompt_tokens_total", answer["prompt_tokens"])
                 else:
                     st.session_state.chat_history.append({
                         "role": "assistant",
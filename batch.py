@@ -0,0 +1,212 @@
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from datetime import date, timedelta
+from pathlib import Path
+from core.analysis import run_analysis, get_analysis_key
+from core.trend_core import get_cached_insights
+from core import metrics
+from core.embedding_backends import DEFAULT_EMBEDDING_BACKEND, EMBEDDING_BACKENDS
+from scrapers.reddit_scraper import DEFAULT_SUBREDDITS, DEFAULT_SORTS, parse_subreddits, parse_sort
+
+BATCH_WORKERS = 4
+# Fetching shares the Reddit rate limit and processing shares the LLM and
+# embedding quota, so each stage gets its own cap on top of the pool size.
+DEFAULT_STAGE_LIMITS = {"fetch": 2, "process": 4}
+
+class StageLimiter:
+    # Stands in for a Job: run_analysis reports each stage change, and the
+    # limiter holds that stage's semaphore until the next stage starts. The
+    # fetch limit is not tied to a stage label, since posts stream in during
+    # "process"; run_analysis takes fetch_slot() around the Reddit traffic
+    # itself.
+    def __init__(self, semaphores: dict):
+        self.semaphores = semaphores
+        self.stage = None
+        self._held = None
+
+    def fetch_slot(self):
+        return self.semaphores.get("fetch") or nullcontext()
+
+    def report(self, stage: str, progress: float, message: str = ""):
+        if stage == self.stage:
+            return
+        self.release()
+        self.stage = stage
+        if stage in self.semaphores and stage != "fetch":
+            self.semaphores[stage].acquire()
+            self._held = self.semaphores[stage]
+
+    def release(self):
+        if self._held is not None:
+            self._held.release()
+            self._held = None
+
+def entry_id(entry: dict) -> str:
+    return entry.get("id") or f"{entry['topic']}|{entry.get('source', 'Reddit')}|{entry['start_date']}|{entry['end_date']}"
+
+def read_entries(path: Path) -> list:
+    entries = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "topic" not in entry:
+                raise ValueError(f"{path}:{line_number}: missing 'topic'")
+            today = date.today()
+            entry.setdefault("start_date", str(today - timedelta(days=7)))
+            entry.setdefault("end_date", str(today))
+            entries.append(entry)
+    return entries
+
+def read_completed(path: Path) -> set:
+    completed = set()
+    if not path.exists():
+        return completed
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line; that entry is rerun.
+                continue
+            if record.get("status") == "done":
+                completed.add(record["id"])
+    return completed
+
+def analyze_entry(entry: dict, semaphores: dict, cache_enabled: bool, date_bounded: bool,
+                  embedding_backend: str, subreddits=DEFAULT_SUBREDDITS, sorts=DEFAULT_SORTS) -> dict:
+    limiter = StageLimiter(semaphores)
+    started = time.time()
+    record = {
+        "id": entry_id(entry),
+        "topic": entry["topic"],
+        "source": entry.get("source", "Reddit"),
+        "start_date": entry["start_date"],
+        "end_date": entry["end_date"]
+    }
+    try:
+        start_date, end_date = date.fromisoformat(entry["start_date"]), date.fromisoformat(entry["end_date"])
+        summary = None
+        if cache_enabled:
+            # A batch record only needs the insights, so a cached analysis is
+            # read from its summary without restoring the vector store.
+            cache_key = get_analysis_key(entry["topic"], record["source"], start_date, end_date,
+                                         date_bounded, embedding_backend, subreddits, sorts)
+            with metrics.trace(f"analysis:{entry['topic']}") as cache_trace:
+                summary = get_cached_insights(cache_key)
+        if summary is not None and summary.get("post_count") is not None:
+            record.update({
+                "status": "done",
+                "from_cache": True,
+                "post_count": summary["post_count"],
+                "key_insights": summary.get("summary", ""),
+                "insight_sources": summary.get("sources", []),
+                "stats": {},
+                "timings": cache_trace.summary()
+            })
+        else:
+            result = run_analysis(
+                entry["topic"], record["source"], start_date, end_date,
+                cache_enabled, date_bounded, job=limiter, embedding_backend=embedding_backend,
+                subreddits=subreddits, sorts=sorts
+            )
+            post_count = result["post_count"]
+            if post_count is None:
+                post_count = result["vector_store"]._collection.count()
+            record.update({
+                "status": "done",
+                "from_cache": result["from_cache"],
+                "post_count": post_count,
+                "key_insights": result["key_insights"],
+                "insight_sources": result["insight_sources"],
+                "stats": result["stats"],
+                "timings": result["timings"]
+            })
+    except Exception as e:
+        print(f"Error analyzing {entry['topic']}: {str(e)}")
+        record.update({"status": "failed", "error": str(e)})
+    finally:
+        limiter.release()
+    record["seconds"] = round(time.time() - started, 3)
+    return record
+
+def run_batch(input_path: Path, output_path: Path, workers: int = BATCH_WORKERS, stage_limits: dict = None,
+              cache_enabled: bool = True, date_bounded: bool = True,
+              embedding_backend: str = DEFAULT_EMBEDDING_BACKEND, subreddits=DEFAULT_SUBREDDITS,
+              sorts=DEFAULT_SORTS) -> dict:
+    entries = read_entries(input_path)
+    completed = read_completed(output_path)
+    pending = [entry for entry in entries if entry_id(entry) not in completed]
+    print(f"{len(entries)} topics, {len(entries) - len(pending)} already done, {len(pending)} to run")
+    semaphores = {
+        stage: threading.Semaphore(limit)
+        for stage, limit in (stage_limits or DEFAULT_STAGE_LIMITS).items()
+    }
+    output_lock = threading.Lock()
+    totals = {"done": 0, "failed": 0, "posts": 0}
+    started = time.time()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "a") as out, ThreadPoolExecutor(max_workers=workers) as executor:
+        if out.tell() > 0:
+            with open(output_path, "rb") as f:
+                f.seek(-1, 2)
+                if f.read(1) != b"\n":
+                    out.write("\n")
+        futures = [
+            executor.submit(analyze_entry, entry, semaphores, cache_enabled, date_bounded, embedding_backend,
+                            subreddits, sorts)
+            for entry in pending
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            with output_lock:
+                out.write(json.dumps(record, default=str) + "\n")
+                out.flush()
+            totals[record["status"]] += 1
+            totals["posts"] += record.get("post_count") or 0
+            elapsed = max(time.time() - started, 1e-9)
+            print(
+                f"[{totals['done'] + totals['failed']}/{len(pending)}] {record['topic']}: {record['status']} "
+                f"in {record['seconds']:.1f}s | {60 * (totals['done'] + totals['failed']) / elapsed:.2f} topics/min, "
+                f"{totals['posts'] / elapsed:.1f} posts/s"
+            )
+    totals["seconds"] = time.time() - started
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze many topics without the Streamlit UI.")
+    parser.add_argument("input", type=Path, help="JSONL file with topic, start_date, end_date and optional source/id per line")
+    parser.add_argument("output", type=Path, help="JSONL file results are appended to; completed entries are skipped on rerun")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--fetch-concurrency", type=int, default=DEFAULT_STAGE_LIMITS["fetch"])
+    parser.add_argument("--process-concurrency", type=int, default=DEFAULT_STAGE_LIMITS["process"])
+    parser.add_argument("--no-cache", action="store_true", help="Skip the analysis and post caches")
+    parser.add_argument("--all-time", action="store_true", help="Search by relevance instead of newest posts in the date range")
+    parser.add_argument("--embedding-backend", choices=list(EMBEDDING_BACKENDS), default=DEFAULT_EMBEDDING_BACKEND)
+    parser.add_argument("--subreddits", nargs="+", default=list(DEFAULT_SUBREDDITS),
+                        help="Subreddits to search (default: all)")
+    parser.add_argument("--sorts", nargs="+", type=parse_sort, default=list(DEFAULT_SORTS), metavar="SORT[:TIME]",
+                        help="Listings searched in parallel with --all-time, e.g. relevance top:week hot")
+    args = parser.parse_args()
+    totals = run_batch(
+        args.input, args.output, args.workers,
+        {"fetch": args.fetch_concurrency, "process": args.process_concurrency},
+        cache_enabled=not args.no_cache, date_bounded=not args.all_time,
+        embedding_backend=args.embedding_backend, subreddits=parse_subreddits(args.subreddits),
+        sorts=tuple(args.sorts)
+    )
+    minutes = max(totals["seconds"], 1e-9) / 60
+    print(
+        f"Finished {totals['done']} topics ({totals['failed']} failed) in {totals['seconds']:.1f}s: "
+        f"{(totals['done'] + totals['failed']) / minutes:.2f} topics/min, "
+        f"{totals['posts'] / max(totals['seconds'], 1e-9):.1f} posts/s"
+    )
+
+if __name__ == "__main__":
+    main()
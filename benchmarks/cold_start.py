@@ -0,0 +1,93 @@
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+# Cumulative `python -X importtime` budget per module in milliseconds.
+COLD_START_BUDGET_MS = {
+    "core.analysis": 700,
+    "core.text_processor": 650,
+    "core.trend_core": 650,
+    "core.trend_signals": 300,
+    "scrapers.reddit_scraper": 150,
+    "batch": 700,
+}
+# Heavy dependencies that must only load when a backend is first used.
+DEFERRED_MODULES = (
+    "streamlit", "chromadb", "langchain_community.vectorstores", "langchain.chains",
+    "langchain.memory", "praw", "wordcloud", "matplotlib", "tiktoken",
+)
+CREDENTIAL_VARS = ("OPENAI_API_KEY", "REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USER_AGENT")
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+TOP_IMPORTS = 10
+
+def _import_once(module: str, workdir: str) -> dict:
+    # Fresh interpreter without credentials, so the import can't lean on
+    # anything set up by a previous import or on a configured environment.
+    env = {key: value for key, value in os.environ.items() if key not in CREDENTIAL_VARS}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")]))
+    check = f"import sys, {module}; print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", check],
+        cwd=workdir, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    imports = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            imports[match.group(4)] = int(match.group(2)) / 1000
+    return {
+        "total_ms": imports.get(module, 0.0),
+        "imports": imports,
+        "deferred_loaded": [name for name in completed.stdout.strip().split(",") if name]
+    }
+
+def measure(module: str, repeat: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="trend_cold_start_")
+    try:
+        (Path(workdir) / "data" / ".cache").mkdir(parents=True)
+        runs = [_import_once(module, workdir) for _ in range(repeat)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    median_run = sorted(runs, key=lambda run: run["total_ms"])[len(runs) // 2]
+    return {
+        "total_ms": round(statistics.median(run["total_ms"] for run in runs), 1),
+        "imports": median_run["imports"],
+        "deferred_loaded": median_run["deferred_loaded"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import time per module against a budget.")
+    parser.add_argument("--modules", nargs="+", choices=list(COLD_START_BUDGET_MS), default=list(COLD_START_BUDGET_MS))
+    parser.add_argument("--repeat", type=int, default=5, help="Imports per module; the median is reported")
+    args = parser.parse_args()
+    failures = []
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        budget = COLD_START_BUDGET_MS[module]
+        status = "ok" if result["total_ms"] <= budget else "OVER"
+        print(f"{module:<26}{result['total_ms']:>9.1f} ms  budget {budget:>5} ms  {status}")
+        if result["total_ms"] > budget:
+            failures.append(f"{module}: {result['total_ms']:.1f} ms > {budget} ms")
+            heaviest = sorted(result["imports"].items(), key=lambda item: item[1], reverse=True)
+            for name, ms in heaviest[1:TOP_IMPORTS + 1]:
+                print(f"    {name:<50}{ms:>9.1f} ms")
+        if result["deferred_loaded"]:
+            failures.append(f"{module}: loads {', '.join(result['deferred_loaded'])} at import")
+    if failures:
+        print("Cold-start budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("All modules within their cold-start budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+CORPUS_SEED = 1234
+VOCABULARY_SIZE = 5000
+TOPIC_TERMS = ("battery", "charging", "range", "subsidy", "recall", "software", "autopilot", "price")
+DUPLICATE_RATE = 0.05
+LONG_POST_RATE = 0.03
+FAKE_EMBEDDING_DIM = 256
+
+class CallCounter:
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfghjklmnprstvz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+
+def synthetic_corpus(size: int, seed: int = CORPUS_SEED, days: int = 7,
+                     now: Optional[datetime] = None) -> List[tuple]:
+    # Deterministic Reddit-like posts: Zipf-ish word frequencies, a few topic
+    # terms, some near-duplicate reposts and some posts long enough to chunk.
+    rng = random.Random(seed)
+    vocabulary = [_word(rng) for _ in range(VOCABULARY_SIZE)]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+    now = now or datetime(2026, 1, 8)
+    posts = []
+    for i in range(size):
+        if posts and rng.random() < DUPLICATE_RATE:
+            content = posts[rng.randrange(len(posts))][0] + " edit: typo"
+        else:
+            length = rng.randint(400, 1500) if rng.random() < LONG_POST_RATE else rng.randint(20, 120)
+            words = rng.choices(vocabulary, weights, k=length)
+            for _ in range(rng.randint(1, 3)):
+                words.insert(rng.randrange(len(words) + 1), rng.choice(TOPIC_TERMS))
+            content = f"{' '.join(words[:8]).capitalize()}\n{' '.join(words[8:])}"
+        created = now - timedelta(seconds=rng.randint(0, days * 86400))
+        posts.append((content, {
+            "url": f"https://www.reddit.com/r/bench/comments/p{i}/",
+            "id": f"p{i}",
+            "subreddit": "bench",
+            "created_utc": created.timestamp()
+        }))
+    return posts
+
+class FakeSubmission:
+    def __init__(self, content: str, metadata: dict):
+        self.title, _, self.selftext = content.partition("\n")
+        self.id = metadata["id"]
+        self.permalink = metadata["url"][len("https://www.reddit.com"):]
+        self.subreddit = metadata["subreddit"]
+        self.created_utc = metadata["created_utc"]
+
+class FakeSubreddit:
+    def __init__(self, reddit: "FakeReddit"):
+        self.reddit = reddit
+
+    def search(self, keyword: str, sort: str = "relevance", time_filter: str = "all", limit: Optional[int] = None):
+        self.reddit.counter.add("reddit.search")
+        submissions = self.reddit.submissions
+        if sort == "new":
+            submissions = sorted(submissions, key=lambda post: post.created_utc, reverse=True)
+        if limit is not None:
+            submissions = submissions[:limit]
+        for i, submission in enumerate(submissions):
+            # One simulated request per 100-item listing page, like PRAW.
+            if i % 100 == 0:
+                self.reddit.counter.add("reddit.page")
+                time.sleep(self.reddit.page_latency)
+            yield submission
+
+class FakeClock:
+    # Simulated monotonic clock for TokenBucket: waiting advances it at once.
+    def __init__(self):
+        self.now = 0.0
+        self.waited = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def wait(self, seconds: float, stop_event=None) -> bool:
+        self.now += seconds
+        self.waited += seconds
+        return stop_event is not None and stop_event.is_set()
+
+class FakeReddit:
+    def __init__(self, corpus: List[tuple], counter: CallCounter, page_latency: float = 0.0):
+        self.submissions = [FakeSubmission(content, metadata) for content, metadata in corpus]
+        self.counter = counter
+        self.page_latency = page_latency
+
+    def subreddit(self, name: str) -> FakeSubreddit:
+        return FakeSubreddit(self)
+
+class FakeEmbeddings(Embeddings):
+    # Deterministic per-text vectors, so cosine scores are stable across runs.
+    def __init__(self, counter: CallCounter, latency: float = 0.0, dim: int = FAKE_EMBEDDING_DIM):
+        self.counter = counter
+        self.latency = latency
+        self.dim = dim
+        self.model = f"fake-{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.random.RandomState(zlib.crc32(text.encode())).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.counter.add("embeddings.calls")
+        self.counter.add("embeddings.texts", len(texts))
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class FakeChatModel(BaseChatModel):
+    counter: Any
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.counter.add("chat.calls")
+        self.counter.add("chat.prompt_chars", sum(len(str(message.content)) for message in messages))
+        time.sleep(self.latency)
+        text = "\n".join(f"- Insight {i + 1} about battery range and charging prices" for i in range(5))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+class FakeSearch:
+    # Local stand-in for the web search backend (see core.web_search.set_search_backend).
+    def __init__(self, counter: CallCounter, latency: float = 0.0):
+        self.counter = counter
+        self.latency = latency
+
+    def __call__(self, query: str) -> str:
+        self.counter.add("search.calls")
+        time.sleep(self.latency)
+        return f"Web results for: {query}"
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+CASES = ("search_reddit_posts", "stream_reddit_posts", "create_vector_store", "process_and_store_texts", "process_shared_posts",
+         "generate_wordcloud", "cache_roundtrip", "answer_with_web_fallback")
+SIZES = (100, 1000, 10000)
+DEFAULT_LATENCY = {"reddit_page": 0.02, "embedding_call": 0.005, "chat_call": 0.05, "web_search": 0.1}
+REGRESSION_THRESHOLD = 0.25
+# Differences below these are noise on the small cases, whatever the ratio.
+MIN_WALL_REGRESSION = 0.05
+MIN_MEMORY_REGRESSION_MB = 16
+
+def _install_fakes(corpus, counter, latency: dict):
+    # Everything that would leave the machine is swapped for an in-process
+    # stand-in before the case runs; the code under test is unchanged.
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings, FakeReddit, FakeSearch
+    import core.chat_backends
+    import core.embedding_backends
+    import core.web_search
+    import scrapers.reddit_scraper
+    core.chat_backends.CHAT_BACKENDS["openai"] = (
+        lambda model_name, temperature: FakeChatModel(counter=counter, latency=latency["chat_call"])
+    )
+    core.embedding_backends.EMBEDDING_BACKENDS["openai"] = lambda: FakeEmbeddings(counter, latency["embedding_call"])
+    scrapers.reddit_scraper._reddit_client = FakeReddit(corpus, counter, latency["reddit_page"])
+    # Pacing runs on a simulated clock, so cases measure work rather than sleeps.
+    scrapers.reddit_scraper._rate_limiter = _tracked_bucket(counter)
+    core.web_search.set_search_backend(FakeSearch(counter, latency["web_search"]))
+
+def _tracked_bucket(counter):
+    # A rate limiter on a simulated clock that records, for every token it
+    # hands out, how many listing pages had been requested by then.
+    from benchmarks.fakes import FakeClock
+    from scrapers.reddit_scraper import TokenBucket
+    clock = FakeClock()
+    bucket = TokenBucket(clock=clock, wait=clock.wait)
+    bucket.pages_at_acquire = []
+    acquire = bucket.acquire
+    bucket.acquire = lambda stop_event=None: bucket.pages_at_acquire.append(counter.counts.get("reddit.page", 0)) or acquire(stop_event)
+    bucket.fake_clock = clock
+    return bucket
+
+def _check_paced(bucket, counter, posts: list, expected: int):
+    # Every listing page must have been requested only after its token was taken.
+    pages = counter.counts.get("reddit.page", 0)
+    pages_at_acquire = bucket.pages_at_acquire
+    if len(posts) != expected or len(pages_at_acquire) < pages:
+        raise RuntimeError(f"Fetched {len(posts)} posts over {pages} pages with {len(pages_at_acquire)} tokens")
+    if any(seen > i for i, seen in enumerate(pages_at_acquire)):
+        raise RuntimeError(f"A listing page was requested before its token: {pages_at_acquire}")
+    expected_wait = max(0, pages - bucket.capacity) / bucket.rate
+    if bucket.fake_clock.waited < expected_wait - 1:
+        raise RuntimeError(f"Rate limiter waited {bucket.fake_clock.waited:.1f}s, expected at least {expected_wait:.1f}s")
+
+def _stream_paced(corpus: list):
+    # Streams every post through an explicit rate limiter.
+    import scrapers.reddit_scraper
+    from scrapers.reddit_scraper import stream_reddit_posts
+    counter = scrapers.reddit_scraper._reddit_client.counter
+    bucket = _tracked_bucket(counter)
+    posts = list(stream_reddit_posts("battery", max_posts=len(corpus), limit_per_listing=len(corpus), rate_limiter=bucket))
+    _check_paced(bucket, counter, posts, len(corpus))
+
+def _search_paced(corpus: list):
+    # The date-bounded walk takes its tokens from the shared limiter.
+    import scrapers.reddit_scraper
+    from scrapers.reddit_scraper import search_reddit_posts
+    counter = scrapers.reddit_scraper._reddit_client.counter
+    bucket = scrapers.reddit_scraper._rate_limiter
+    bucket.pages_at_acquire.clear()
+    posts = search_reddit_posts("battery", max_posts=len(corpus), start_date=date(2026, 1, 1),
+                                end_date=date(2026, 1, 8), date_bounded=True)
+    _check_paced(bucket, counter, posts, len(corpus))
+
+def _answer_with_web_fallback(conversation_chain, vector_store, question: str):
+    # The synthetic corpus has nothing close to the question, so the web
+    # search must start alongside the chain and its result be cached for
+    # the fallback, rather than searched again.
+    from core.answer_cache import normalize_question
+    from core.text_processor import answer_question
+    from core.web_search import get_web_search
+    web_search = get_web_search()
+    answer = answer_question(conversation_chain, vector_store, question)
+    if not answer["speculative"]:
+        raise RuntimeError(f"No speculative web search at retrieval confidence {answer['confidence']:.2f}")
+    web_search.search(question)
+    if normalize_question(question) not in web_search.entries:
+        raise RuntimeError("The speculative web search result was not cached")
+    if web_search.backend.counter.counts.get("search.calls") != 1:
+        raise RuntimeError(f"Expected one web search call, got {web_search.backend.counter.counts.get('search.calls')}")
+
+def _prepare_case(case: str, corpus: list):
+    # Returns the timed callable; anything done here is setup and not measured.
+    from core.text_processor import create_conversation_chain, create_documents, create_vector_store, process_and_store_texts
+    from core.trend_core import cache_results, generate_wordcloud, get_cached_results
+    from core.trend_signals import build_term_signals
+    # Heavy dependencies load on first use; import them here so the cases
+    # measure steady-state work (cold imports are tracked by cold_start.py).
+    import chromadb, langchain.chains, langchain_community.vectorstores, wordcloud
+    import core.chat_memory, core.chunking, core.corpus_index, core.dedup, core.embedding_cache, core.insights
+    import core.pipeline, core.retrieval
+    texts = [content for content, _ in corpus]
+    metadatas = [metadata for _, metadata in corpus]
+    if case == "search_reddit_posts":
+        return lambda: _search_paced(corpus)
+    if case == "stream_reddit_posts":
+        return lambda: _stream_paced(corpus)
+    if case == "create_vector_store":
+        documents = create_documents(texts, metadatas)
+        return lambda: create_vector_store(documents)
+    if case == "process_and_store_texts":
+        posts = [(content, dict(metadata)) for content, metadata in corpus]
+        return lambda: process_and_store_texts(posts, {"source": "Reddit", "topic": "battery"})
+    if case == "process_shared_posts":
+        # The same posts analysed under a second topic: they are already in
+        # the shared corpus, so only the topic flag and insights are new work.
+        posts = [(content, dict(metadata)) for content, metadata in corpus]
+        process_and_store_texts([(content, dict(metadata)) for content, metadata in corpus],
+                                {"source": "Reddit", "topic": "battery"}, corpus_view={"topic": "battery"})
+        return lambda: process_and_store_texts(posts, {"source": "Reddit", "topic": "charging"},
+                                               corpus_view={"topic": "charging"})
+    if case == "generate_wordcloud":
+        text = "\n".join(texts)
+        return lambda: generate_wordcloud(text)
+    if case == "cache_roundtrip":
+        vector_store = create_vector_store(create_documents(texts, metadatas))
+        insights = [f"Insight {i}" for i in range(5)]
+        sources = [[{"url": metadatas[i]["url"], "score": 1.0, "id": metadatas[i]["id"]}] for i in range(5)]
+        term_signals = build_term_signals(texts, metadatas)
+
+        def roundtrip():
+            cache_results("bench", vector_store, insights, None, sources, topic="battery", term_signals=term_signals)
+            if get_cached_results("bench") is None:
+                raise RuntimeError("Cache round-trip returned nothing")
+        return roundtrip
+    if case == "answer_with_web_fallback":
+        vector_store = create_vector_store(create_documents(texts, metadatas))
+        conversation_chain = create_conversation_chain(vector_store, memory_mode="buffer", retrieval_mode="dense")
+        return lambda: _answer_with_web_fallback(conversation_chain, vector_store, "Who won the 1998 world cup final?")
+    raise ValueError(f"Unknown benchmark case: {case}")
+
+def run_case(case: str, size: int, latency: dict) -> dict:
+    # Runs inside a fresh process and working directory, so every cache starts
+    # cold and ru_maxrss only reflects this case.
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    for var in ("OPENAI_API_KEY", "REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USER_AGENT"):
+        os.environ.setdefault(var, "benchmark")
+    Path("data/.cache").mkdir(parents=True, exist_ok=True)
+    from benchmarks.fakes import CallCounter, synthetic_corpus
+    corpus = synthetic_corpus(size)
+    counter = CallCounter()
+    _install_fakes(corpus, counter, latency)
+    timed = _prepare_case(case, corpus)
+    counter.counts.clear()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    timed()
+    wall = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "case": case,
+        "size": size,
+        "wall_seconds": round(wall, 4),
+        "peak_memory_mb": round((rss_after - rss_before) / 1024, 1),
+        "calls": dict(sorted(counter.counts.items()))
+    }
+
+def _run_in_subprocess(case: str, size: int, latency: dict) -> dict:
+    workdir = tempfile.mkdtemp(prefix="trend_bench_")
+    try:
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")]))}
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run_benchmarks", "--case", case, "--size", str(size),
+             "--latency", json.dumps(latency)],
+            cwd=workdir, env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"{case} ({size} posts) failed:\n{completed.stderr[-2000:]}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_suite(cases=CASES, sizes=SIZES, latency=None, repeat: int = 1) -> dict:
+    latency = latency or DEFAULT_LATENCY
+    results = {}
+    for case in cases:
+        for size in sizes:
+            runs = [_run_in_subprocess(case, size, latency) for _ in range(repeat)]
+            result = dict(runs[0])
+            result["wall_seconds"] = round(statistics.median(run["wall_seconds"] for run in runs), 4)
+            result["peak_memory_mb"] = round(statistics.median(run["peak_memory_mb"] for run in runs), 1)
+            results[f"{case}/{size}"] = result
+            print(f"{case:<26}{size:>7} posts  {result['wall_seconds']:>9.3f}s  {result['peak_memory_mb']:>8.1f} MB  "
+                  f"{json.dumps(result['calls'])}")
+    return {"latency": latency, "results": results}
+
+def compare_to_baseline(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    if current["latency"] != baseline.get("latency"):
+        print("Baseline was recorded with different fake latencies; skipping comparison")
+        return []
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        wall, base_wall = result["wall_seconds"], base["wall_seconds"]
+        if wall > base_wall * (1 + threshold) and wall - base_wall > MIN_WALL_REGRESSION:
+            regressions.append(f"{name}: wall time {base_wall:.3f}s -> {wall:.3f}s")
+        memory, base_memory = result["peak_memory_mb"], base["peak_memory_mb"]
+        if memory > base_memory * (1 + threshold) and memory - base_memory > MIN_MEMORY_REGRESSION_MB:
+            regressions.append(f"{name}: peak memory {base_memory:.1f} MB -> {memory:.1f} MB")
+        # The fakes are deterministic, so any extra external call is a real behaviour change.
+        for call, count in result["calls"].items():
+            base_count = base["calls"].get(call, 0)
+            if count > base_count:
+                regressions.append(f"{name}: {call} {base_count} -> {count}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with fake Reddit, embedding and chat backends.")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the median is reported")
+    parser.add_argument("--latency", type=json.loads, default=None,
+                        help=f"Fake latencies in seconds as JSON (default {json.dumps(DEFAULT_LATENCY)})")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", type=Path, help="Also write the results as JSON")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    latency = {**DEFAULT_LATENCY, **(args.latency or {})}
+    if args.case:
+        print(json.dumps(run_case(args.case, args.size, latency)))
+        return
+    current = run_suite(args.cases, args.sizes, latency, args.repeat)
+    if args.output:
+        args.output.write_text(json.dumps(current, indent=2) + "\n")
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(current, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+        return
+    regressions = compare_to_baseline(current, json.loads(args.baseline.read_text()), args.threshold)
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+from contextlib import nullcontext
+from scrapers.reddit_scraper import iter_reddit_posts, DEFAULT_SUBREDDITS, DEFAULT_SORTS
+from core.text_processor import process_and_store_texts, get_similar_chunks
+from core.trend_core import get_cache_key, get_cached_results, cache_results, get_cache_ttl
+from core.post_cache import iter_posts_for_range
+from core.embedding_backends import DEFAULT_EMBEDDING_BACKEND
+from core.cache_store import single_flight
+from core.corpus_index import maybe_compact_corpus
+from core import metrics
+
+def get_fetch_source(source: str, date_bounded: bool, subreddits=DEFAULT_SUBREDDITS, sorts=DEFAULT_SORTS) -> str:
+    # Default listings keep the plain source name, so existing cache entries stay valid.
+    fetch_source = f"{source}/new" if date_bounded else source
+    if tuple(subreddits) != DEFAULT_SUBREDDITS:
+        fetch_source += "/r/" + "+".join(sorted(subreddits))
+    if not date_bounded and tuple(sorts) != DEFAULT_SORTS:
+        fetch_source += "/" + ",".join(f"{sort}:{time_filter}" for sort, time_filter in sorted(sorts))
+    return fetch_source
+
+def get_analysis_key(topic: str, source: str, start_date, end_date, date_bounded: bool = True,
+                     embedding_backend: str = DEFAULT_EMBEDDING_BACKEND, subreddits=DEFAULT_SUBREDDITS,
+                     sorts=DEFAULT_SORTS) -> str:
+    return get_cache_key(topic, get_fetch_source(source, date_bounded, subreddits, sorts), start_date, end_date,
+                         embedding_backend)
+
+def _report(job, stage: str, progress: float, message: str = ""):
+    if job is not None:
+        job.report(stage, progress, message)
+
+def _fetch_slot(job):
+    # Batch runs cap how many analyses talk to Reddit at once; other jobs
+    # have no fetch_slot and aren't limited.
+    fetch_slot = getattr(job, "fetch_slot", None)
+    return fetch_slot() if fetch_slot is not None else nullcontext()
+
+def _stream_in_fetch_slot(posts, job):
+    # Streaming fetches pages in the background for as long as posts are
+    # being pulled, so the slot is held until the stream ends or is closed.
+    with _fetch_slot(job):
+        yield from posts
+
+def run_analysis(topic: str, source: str, start_date, end_date, cache_enabled: bool = True,
+                 date_bounded: bool = True, job=None, embedding_backend: str = DEFAULT_EMBEDDING_BACKEND,
+                 subreddits=DEFAULT_SUBREDDITS, sorts=DEFAULT_SORTS) -> dict:
+    with metrics.trace(f"analysis:{topic}") as analysis_trace:
+        result = _run_analysis(topic, source, start_date, end_date, cache_enabled, date_bounded, job, embedding_backend,
+                               tuple(subreddits), tuple(sorts))
+    result["timings"] = analysis_trace.summary()
+    metrics.write_prometheus_textfile()
+    return result
+
+def _add_fetch_stats(stats: dict, fetch_stats: dict):
+    # Fetched/kept post counts across every Reddit walk the analysis made.
+    total = stats.setdefault("fetch", {"fetched": 0, "kept": 0})
+    for key in total:
+        total[key] += fetch_stats.get(key, 0)
+
+def _run_analysis(topic: str, source: str, start_date, end_date, cache_enabled: bool, date_bounded: bool,
+                  job, embedding_backend: str, subreddits: tuple, sorts: tuple) -> dict:
+    fetch_source = get_fetch_source(source, date_bounded, subreddits, sorts)
+    stats = {}
+    cache_key = get_cache_key(topic, fetch_source, start_date, end_date, embedding_backend)
+    post_count = None
+
+    def compute():
+        nonlocal post_count
+        _report(job, "fetch", 0.1, f"Fetching posts from {source}...")
+        def fetch_posts(range_start, range_end, fetch_stats=None):
+            fetch_stats = {} if fetch_stats is None else fetch_stats
+            try:
+                yield from iter_reddit_posts(topic, start_date=range_start, end_date=range_end, date_bounded=date_bounded,
+                                             subreddits=subreddits, sorts=sorts, stats=fetch_stats)
+            finally:
+                _add_fetch_stats(stats, fetch_stats)
+
+        # Posts stream straight into embedding and indexing; with the post
+        # cache, cached days come from their shards and only the missing
+        # ranges are fetched, their shards written as each walk ends.
+        if cache_enabled:
+            posts = iter_posts_for_range(topic, fetch_source, start_date, end_date, fetch_posts,
+                                         newest_first=date_bounded)
+        else:
+            posts = fetch_posts(start_date, end_date)
+        content = _stream_in_fetch_slot(posts, job)
+        _report(job, "process", 0.2, f"Streaming posts from {source} into the index...")
+        metadata = {
+            "source": source,
+            "topic": topic,
+            "date_range": f"{start_date} to {end_date}"
+        }
+        # Posts land in the shared corpus; the analysis works on its topic and date-range view.
+        corpus_view = {"topic": topic, "start_date": start_date, "end_date": end_date}
+        results = process_and_store_texts(content, metadata, stats, embedding_backend, corpus_view=corpus_view)
+        vector_store, key_insights, conversation_chain, insight_sources, term_signals = results
+        post_count = vector_store._collection.count()
+        if cache_enabled:
+            _report(job, "cache_write", 0.9, "Caching results...")
+            cache_results(cache_key, vector_store, key_insights, conversation_chain, insight_sources,
+                          topic=topic, ttl=get_cache_ttl(end_date), term_signals=term_signals)
+        maybe_compact_corpus()
+        return results
+
+    if cache_enabled:
+        _report(job, "cache", 0.05, "Checking cache...")
+        # Concurrent misses for the same key, from any worker process, share a
+        # single computation; the others wait and then load it from the cache.
+        results, computed = single_flight(cache_key, lambda: get_cached_results(cache_key), compute)
+        from_cache = not computed
+    else:
+        results = compute()
+        from_cache = False
+    vector_store, key_insights, conversation_chain, insight_sources, term_signals = results
+    _report(job, "finalize", 0.95, "Preparing results...")
+    return {
+        "cache_key": cache_key,
+        "from_cache": from_cache,
+        "post_count": post_count,
+        "stats": stats,
+        "vector_store": vector_store,
+        "key_insights": key_insights,
+        "insight_sources": insight_sources,
+        "term_signals": term_signals,
+        "similar_chunks": [chunk.page_content for chunk in get_similar_chunks(vector_store, topic)[:5]]
+    }
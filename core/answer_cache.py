@@ -0,0 +1,166 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from core.embedding_cache import normalize_text
+from core import metrics
+
+ANSWER_CACHE_MAX_ENTRIES = 256
+ANSWER_CACHE_MAX_CORPORA = 16
+# Question pairs that read alike but need different answers, and paraphrases
+# that don't. The similarity threshold for each embedding model is set just
+# above its most similar different-meaning pair, since raw cosine ranges
+# differ a lot between models (ada-002 puts unrelated questions near 0.7).
+CALIBRATION_PAIRS = (
+    ("What are people saying about the battery?", "What are people saying about the charger?", False),
+    ("Why do users like the new update?", "Why do users dislike the new update?", False),
+    ("What happened last week?", "What happened last month?", False),
+    ("Which brand is most popular?", "Which brand is least popular?", False),
+    ("Is the price going up?", "Is the price going down?", False),
+    ("What are the main complaints?", "What are the main compliments?", False),
+    ("How do people feel about Tesla?", "How do people feel about Ford?", False),
+    ("Tell me more about that", "Tell me more about the recall", False),
+    ("What are the main complaints?", "What do people complain about most?", True),
+    ("Summarize the discussion", "Give me a summary of the discussion", True),
+    ("Why are people upset?", "Why are users upset?", True),
+)
+CALIBRATION_MARGIN = 0.01
+# Some models score antonyms almost as close as paraphrases (OpenAI puts
+# "like"/"dislike" pairs near 0.97), so the calibrated threshold is clamped
+# to a range where semantic hits still happen.
+THRESHOLD_RANGE = (0.90, 0.97)
+
+def normalize_question(question: str) -> str:
+    return normalize_text(question).lower().rstrip("?!. ")
+
+def corpus_fingerprint(vector_store) -> str:
+    # Identifies the indexed content rather than the analysis parameters, so
+    # re-fetching an open date window with new posts gets a fresh cache. A
+    # corpus view's topic and dates are included too, since views of the
+    # shared corpus with the same posts still frame questions differently.
+    ids = vector_store.get(include=[])["ids"]
+    digest = hashlib.sha256(getattr(vector_store.embeddings, "model_name", "").encode())
+    digest.update(repr(sorted((getattr(vector_store, "spec", None) or {}).items())).encode())
+    for doc_id in sorted(ids):
+        digest.update(b"\0" + doc_id.encode())
+    return digest.hexdigest()
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+_thresholds = {}
+_thresholds_lock = threading.Lock()
+
+def calibrate_threshold(embeddings, pairs=CALIBRATION_PAIRS, margin: float = CALIBRATION_MARGIN,
+                        threshold_range: tuple = THRESHOLD_RANGE) -> float:
+    model_name = getattr(embeddings, "model_name", None) or type(embeddings).__name__
+    with _thresholds_lock:
+        if model_name in _thresholds:
+            return _thresholds[model_name]
+    questions = list(dict.fromkeys(question for pair in pairs for question in pair[:2]))
+    vectors = dict(zip(questions, (_unit(vector) for vector in embeddings.embed_documents(questions))))
+    similarities = [(float(vectors[a] @ vectors[b]), same) for a, b, same in pairs]
+    calibrated = max(similarity for similarity, same in similarities if not same) + margin
+    low, high = threshold_range
+    threshold = min(high, max(low, calibrated))
+    if calibrated > high:
+        metrics.log_event("answer_cache_threshold_clamped", model=model_name, calibrated=round(calibrated, 4),
+                          threshold=threshold)
+    paraphrases = [similarity for similarity, same in similarities if same]
+    metrics.log_event("answer_cache_calibrated", model=model_name, threshold=round(threshold, 4),
+                      paraphrase_recall=sum(s >= threshold for s in paraphrases) / len(paraphrases) if paraphrases else 0.0)
+    with _thresholds_lock:
+        _thresholds[model_name] = threshold
+    return threshold
+
+def _hit(entry: dict, similarity: float, started: float) -> dict:
+    hit = {key: value for key, value in entry.items() if key != "vector"}
+    hit.update({"similarity": similarity, "seconds": time.perf_counter() - started})
+    return hit
+
+class SemanticAnswerCache:
+    # Entries are keyed by the normalized standalone question: follow-ups are
+    # condensed with their conversation before lookup (see
+    # core.text_processor.standalone_question), so any session asking the
+    # same thing of the same corpus shares the answer.
+    def __init__(self, embeddings, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 threshold: Optional[float] = None):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self._threshold = threshold
+        self.entries = OrderedDict()
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._keys = []
+        self._lock = threading.Lock()
+
+    @property
+    def threshold(self) -> float:
+        if self._threshold is None:
+            self._threshold = calibrate_threshold(self.embeddings)
+        return self._threshold
+
+    def _embed(self, question: str) -> np.ndarray:
+        return _unit(self.embeddings.embed_query(question))
+
+    def _rebuild(self):
+        self._keys = list(self.entries)
+        self._vectors = (np.stack([self.entries[key]["vector"] for key in self._keys])
+                         if self._keys else np.zeros((0, 0), dtype=np.float32))
+
+    def lookup(self, question: str) -> Optional[dict]:
+        key = normalize_question(question)
+        started = time.perf_counter()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                metrics.cache_lookup("answers", True)
+                return _hit(entry, 1.0, started)
+            if not self.entries:
+                metrics.cache_lookup("answers", False)
+                return None
+        threshold = self.threshold
+        vector = self._embed(question)
+        with self._lock:
+            if not self._keys or self._vectors.shape[1] != vector.shape[0]:
+                metrics.cache_lookup("answers", False)
+                return None
+            scores = self._vectors @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                metrics.cache_lookup("answers", False)
+                return None
+            match = self._keys[best]
+            entry = self.entries[match]
+            self.entries.move_to_end(match)
+        metrics.cache_lookup("answers", True)
+        return _hit(entry, float(scores[best]), started)
+
+    def store(self, question: str, answer: str, sources: Optional[list] = None):
+        key = normalize_question(question)
+        vector = self._embed(question)
+        with self._lock:
+            self.entries[key] = {"question": question, "answer": answer, "sources": sources or [], "vector": vector}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._rebuild()
+
+_answer_caches = OrderedDict()
+_answer_caches_lock = threading.Lock()
+
+def get_answer_cache(corpus_id: str, embeddings) -> SemanticAnswerCache:
+    # Shared by every session analyzing the same corpus; least recently used
+    # corpora are dropped once ANSWER_CACHE_MAX_CORPORA are held.
+    with _answer_caches_lock:
+        cache = _answer_caches.get(corpus_id)
+        if cache is None:
+            cache = _answer_caches[corpus_id] = SemanticAnswerCache(embeddings)
+            while len(_answer_caches) > ANSWER_CACHE_MAX_CORPORA:
+                _answer_caches.popitem(last=False)
+        _answer_caches.move_to_end(corpus_id)
+        return cache
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+import numpy as np
+
+CACHE_DB_PATH = Path("data/.cache/analysis_cache.sqlite3")
+CACHE_MAX_BYTES = 1 << 30
+LOCK_TTL = 120
+LOCK_POLL_INTERVAL = 0.5
+LOCK_WAIT_TIMEOUT = 30 * 60
+
+def _checksum(*blobs: bytes) -> str:
+    digest = hashlib.sha256()
+    for blob in blobs:
+        digest.update(blob)
+    return digest.hexdigest()
+
+class CacheStore:
+    def __init__(self, path: Path = CACHE_DB_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.corrupt = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, topic TEXT, created_at REAL NOT NULL, expires_at REAL, "
+            "last_access REAL NOT NULL, size INTEGER NOT NULL, "
+            "summary BLOB NOT NULL, summary_checksum TEXT NOT NULL, "
+            "documents BLOB NOT NULL, vectors BLOB NOT NULL, dim INTEGER NOT NULL, "
+            "payload_checksum TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_topic ON entries(topic)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_created_at ON entries(created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS locks ("
+            "key TEXT PRIMARY KEY, owner TEXT NOT NULL, acquired_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def put(self, key: str, summary: dict, documents: list, vectors: np.ndarray,
+            topic: Optional[str] = None, ttl: Optional[float] = None):
+        summary_blob = json.dumps(summary).encode()
+        documents_blob = zlib.compress(json.dumps(documents).encode())
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        vectors_blob = vectors.tobytes()
+        size = len(summary_blob) + len(documents_blob) + len(vectors_blob)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, topic, created_at, expires_at, last_access, size, "
+                "summary, summary_checksum, documents, vectors, dim, payload_checksum) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, topic, now, now + ttl if ttl else None, now, size,
+                 summary_blob, _checksum(summary_blob), documents_blob, vectors_blob,
+                 vectors.shape[1] if vectors.ndim == 2 else 0, _checksum(documents_blob, vectors_blob))
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _live_row(self, key: str, columns: str):
+        row = self._conn.execute(
+            f"SELECT expires_at, {columns} FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[0] is not None and row[0] < time.time():
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+            return None
+        return row[1:]
+
+    def _drop_corrupt(self, key: str):
+        print(f"Cache entry {key} failed its integrity check; dropping it")
+        self.corrupt += 1
+        self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._conn.commit()
+
+    def _touch(self, key: str):
+        self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+
+    def get_summary(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._live_row(key, "summary, summary_checksum")
+            if row is None:
+                self.misses += 1
+                return None
+            summary_blob, checksum = row
+            if _checksum(summary_blob) != checksum:
+                self._drop_corrupt(key)
+                self.misses += 1
+                return None
+            self._touch(key)
+            self.hits += 1
+        return json.loads(summary_blob)
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            row = self._live_row(key, "summary, summary_checksum, documents, vectors, dim, payload_checksum")
+            if row is None:
+                self.misses += 1
+                return None
+            summary_blob, summary_checksum, documents_blob, vectors_blob, dim, payload_checksum = row
+            if (_checksum(summary_blob) != summary_checksum
+                    or _checksum(documents_blob, vectors_blob) != payload_checksum):
+                self._drop_corrupt(key)
+                self.misses += 1
+                return None
+            self._touch(key)
+            self.hits += 1
+        documents = json.loads(zlib.decompress(documents_blob))
+        vectors = np.frombuffer(vectors_blob, dtype=np.float32).reshape(-1, dim) if dim else np.zeros((0, 0), np.float32)
+        return json.loads(summary_blob), documents, vectors
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def try_lock(self, key: str, owner: str, ttl: float = LOCK_TTL) -> bool:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes SQLite's write lock, so the check-and-insert
+            # is atomic across processes sharing the database file.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner, expires_at FROM locks WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[0] != owner and row[1] > now:
+                    self._conn.execute("COMMIT")
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO locks (key, owner, acquired_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, owner, now, now + ttl)
+                )
+                self._conn.execute("COMMIT")
+                return True
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def refresh_lock(self, key: str, owner: str, ttl: float = LOCK_TTL) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE locks SET expires_at = ? WHERE key = ? AND owner = ?", (time.time() + ttl, key, owner)
+            )
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def release_lock(self, key: str, owner: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+            self._conn.commit()
+
+    def is_locked(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM locks WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "corrupt": self.corrupt
+        }
+
+_cache_store = None
+_cache_store_lock = threading.Lock()
+
+def get_cache_store() -> CacheStore:
+    global _cache_store
+    with _cache_store_lock:
+        if _cache_store is None:
+            _cache_store = CacheStore()
+        return _cache_store
+
+def single_flight(key: str, read_cached: Callable[[], object], compute: Callable[[], object],
+                  store: Optional[CacheStore] = None, lock_ttl: float = LOCK_TTL,
+                  wait_timeout: float = LOCK_WAIT_TIMEOUT) -> Tuple[object, bool]:
+    # Returns (value, computed). Only one caller per key across threads and
+    # processes runs compute(); the rest wait for the lock and read the cache.
+    # A holder that dies stops refreshing its lease, so the lock goes stale
+    # after lock_ttl and a waiter takes over.
+    store = store or get_cache_store()
+    owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+    deadline = time.time() + wait_timeout
+    while True:
+        cached = read_cached()
+        if cached is not None:
+            return cached, False
+        if store.try_lock(key, owner, lock_ttl):
+            break
+        while store.is_locked(key) and time.time() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+        if time.time() >= deadline:
+            raise TimeoutError(f"Timed out waiting for another worker to compute {key}")
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        while not stop_heartbeat.wait(lock_ttl / 3):
+            store.refresh_lock(key, owner, lock_ttl)
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    try:
+        cached = read_cached()
+        if cached is not None:
+            return cached, False
+        return compute(), True
+    finally:
+        stop_heartbeat.set()
+        store.release_lock(key, owner)
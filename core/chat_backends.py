@@ -0,0 +1,20 @@
+from typing import Callable, Dict
+from core.credentials import require_credentials
+
+CHAT_MODEL = "gpt-4o"
+SUMMARY_MODEL = "gpt-4o-mini"
+DEFAULT_CHAT_BACKEND = "openai"
+
+def _openai_chat(model_name: str, temperature: float):
+    require_credentials("openai")
+    from langchain_community.chat_models import ChatOpenAI
+    return ChatOpenAI(temperature=temperature, model_name=model_name)
+
+CHAT_BACKENDS: Dict[str, Callable] = {
+    "openai": _openai_chat,
+}
+
+def get_chat_model(model_name: str = CHAT_MODEL, temperature: float = 0.7, backend: str = DEFAULT_CHAT_BACKEND):
+    if backend not in CHAT_BACKENDS:
+        raise ValueError(f"Unknown chat backend: {backend}")
+    return CHAT_BACKENDS[backend](model_name, temperature)
@@ -0,0 +1,121 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.prompts import PromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+from core.tokens import count_tokens, truncate_to_tokens
+from core import metrics
+
+MEMORY_TURNS = 4
+MEMORY_TOKEN_LIMIT = 1500
+SUMMARY_TOKEN_LIMIT = 400
+
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template="""Progressively summarize the conversation between a user and an assistant analyzing social media trends, adding onto the previous summary. Keep the topics, entities and conclusions the user may refer back to, in at most a short paragraph.\n\n        Current summary:\n        {summary}\n\n        New lines of conversation:\n        {new_lines}\n\n        New summary:"""
+)
+
+class RollingSummaryMemory(BaseChatMemory):
+    # Keeps the last `max_turns` exchanges verbatim plus a rolling summary of
+    # everything older, so the history sent with each question stays under
+    # `max_token_limit` however long the session runs. Turns that fall out of
+    # the window are folded into the summary on a background thread; until
+    # that finishes they are simply absent, never blocking the next answer.
+    llm: Any
+    memory_key: str = "chat_history"
+    max_turns: int = MEMORY_TURNS
+    max_token_limit: int = MEMORY_TOKEN_LIMIT
+    summary_token_limit: int = SUMMARY_TOKEN_LIMIT
+    summary: str = ""
+    last_history_tokens: int = 0
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _pending: List[BaseMessage] = PrivateAttr(default_factory=list)
+    _executor: Any = PrivateAttr(default=None)
+    _summarizing: Any = PrivateAttr(default=None)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _history_messages(self) -> List[BaseMessage]:
+        with self._lock:
+            summary = self.summary
+            recent = list(self.chat_memory.messages)
+        prefix = [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] if summary else []
+        # Drop the oldest verbatim turns if long answers push past the budget.
+        while recent and count_tokens(get_buffer_string(prefix + recent)) > self.max_token_limit:
+            recent = recent[2:]
+        return prefix + recent
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = self._history_messages()
+        self.last_history_tokens = count_tokens(get_buffer_string(messages)) if messages else 0
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        with self._lock:
+            messages = self.chat_memory.messages
+            overflow = len(messages) - 2 * self.max_turns
+            if overflow <= 0:
+                return
+            self._pending.extend(messages[:overflow])
+            self.chat_memory.messages = messages[overflow:]
+        self._schedule_summary()
+
+    def _schedule_summary(self):
+        with self._lock:
+            if self._summarizing is not None and not self._summarizing.done():
+                # The running refresh picks up anything added meanwhile.
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            self._summarizing = self._executor.submit(metrics.propagate(self._refresh_summary))
+
+    def _refresh_summary(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                summary = self.summary
+                if not pending:
+                    self._summarizing = None
+                    return
+            try:
+                with metrics.span("memory_summary"):
+                    prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", new_lines=get_buffer_string(pending))
+                    new_summary = self.llm.invoke(prompt).content.strip()
+                metrics.external_call("llm", tokens_in=count_tokens(prompt), tokens_out=count_tokens(new_summary))
+            except Exception as e:
+                print(f"Error summarizing conversation: {str(e)}")
+                with self._lock:
+                    self._pending = pending + self._pending
+                return
+            with self._lock:
+                self.summary = truncate_to_tokens(new_summary, self.summary_token_limit)
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self.summary = ""
+            self._pending = []
+
+class PromptSizeCallback(BaseCallbackHandler):
+    # Records the token size of every LLM prompt a chat turn sends
+    # (question rewriting and answering), for per-turn reporting.
+    def __init__(self):
+        self.prompt_tokens = []
+
+    def reset(self):
+        self.prompt_tokens = []
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        for message_list in messages:
+            self.prompt_tokens.append(count_tokens(get_buffer_string(message_list)))
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.prompt_tokens.extend(count_tokens(prompt) for prompt in prompts)
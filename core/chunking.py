@@ -0,0 +1,49 @@
+import uuid
+from typing import Iterable, Iterator, List, Optional, Tuple
+from langchain_core.documents import Document
+from core.tokens import count_tokens, split_by_tokens
+
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP = 64
+MAX_FOLDED_CHUNKS = 3
+
+def chunk_post(content: str, metadata: Optional[dict] = None, chunk_tokens: int = CHUNK_TOKENS,
+               overlap: int = CHUNK_OVERLAP) -> List[Tuple[str, dict]]:
+    metadata = metadata if metadata is not None else {}
+    parent_id = str(metadata.setdefault("id", uuid.uuid4().hex))
+    pieces = split_by_tokens(content, chunk_tokens, overlap)
+    # The parent dict is shared with upstream stages, so record the chunk
+    # count on it for anything that needs to address the chunks later.
+    metadata["chunk_count"] = len(pieces)
+    chunks = []
+    for i, piece in enumerate(pieces):
+        chunk_metadata = dict(metadata)
+        chunk_metadata.update({
+            "id": parent_id if len(pieces) == 1 else f"{parent_id}#{i}",
+            "parent_id": parent_id,
+            "chunk_index": i,
+            "token_count": count_tokens(piece)
+        })
+        chunks.append((piece, chunk_metadata))
+    return chunks
+
+def chunk_posts(posts: Iterable[Tuple[str, dict]], chunk_tokens: int = CHUNK_TOKENS,
+                overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[str, dict]]:
+    for content, metadata in posts:
+        yield from chunk_post(content, metadata, chunk_tokens, overlap)
+
+def fold_to_parents(documents: List[Document], k: Optional[int] = None,
+                    max_chunks: int = MAX_FOLDED_CHUNKS) -> List[Document]:
+    # Documents are expected best-first; each parent keeps its rank from its
+    # best chunk and gathers up to max_chunks of its hit chunks in reading order.
+    parents = {}
+    for doc in documents:
+        parent_id = doc.metadata.get("parent_id") or doc.metadata.get("id") or id(doc)
+        parents.setdefault(parent_id, []).append(doc)
+    folded = []
+    for hits in parents.values():
+        chunks = sorted(hits[:max_chunks], key=lambda doc: doc.metadata.get("chunk_index", 0))
+        metadata = dict(hits[0].metadata)
+        metadata["matched_chunks"] = len(hits)
+        folded.append(Document(page_content="\n...\n".join(doc.page_content for doc in chunks), metadata=metadata))
+    return folded[:k] if k is not None else folded
@@ -0,0 +1,254 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+from core import metrics
+
+CORPUS_DIR = Path("data/.cache/corpus")
+CORPUS_COLLECTION_PREFIX = "corpus_"
+TOPIC_FLAG_PREFIX = "topic__"
+# Entries no analysis has written or restored for this long are deleted.
+CORPUS_RETENTION_DAYS = float(os.getenv("TREND_CORPUS_RETENTION_DAYS", "30"))
+CORPUS_COMPACT_INTERVAL = 6 * 60 * 60
+CORPUS_DELETE_BATCH_SIZE = 5000
+
+def topic_flag(topic: str) -> str:
+    # A post shared by several topics is stored once and carries one boolean
+    # flag per topic, since Chroma metadata values must be scalars.
+    slug = re.sub(r"[^a-z0-9]+", "_", topic.strip().lower()).strip("_")
+    return TOPIC_FLAG_PREFIX + (slug or hashlib.md5(topic.encode()).hexdigest()[:12])
+
+def _to_date(value) -> Optional[date]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+def _utc_timestamp(day: date) -> float:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+
+_generations: Dict[tuple, int] = {}
+_generations_lock = threading.Lock()
+
+def collection_generation(name: str, flag: Optional[str] = None) -> int:
+    return _generations.get((name, flag), 0)
+
+def _bump_generation(name: str, flag: Optional[str] = None):
+    # Counts in-process writes that can change what a corpus view holds, so
+    # views can tell whether what they derived from it (counts, indexes) is
+    # still current. Writes that only add posts to one topic bump that
+    # topic's counter; ones that may change posts other topics hold (edited
+    # text, deletes) bump the whole collection's.
+    with _generations_lock:
+        _generations[(name, flag)] = _generations.get((name, flag), 0) + 1
+
+def _combine(*conditions) -> Optional[dict]:
+    conditions = [condition for condition in conditions if condition]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+class FilteredCollection:
+    # The part of the chromadb collection API the analysis code uses, with
+    # the view's filter merged into every read and its topic flag into every
+    # write. Chroma merges metadata on upsert, so flags from other topics stay.
+    def __init__(self, collection, name: str, where: Optional[dict], flag: str):
+        self.collection = collection
+        self.name = name
+        self.where = where
+        self.flag = flag
+        self.tags = {flag: True}
+        # Ids whose stored text and vector are known to be current; writes to
+        # them only update metadata, which is far cheaper than re-upserting
+        # into the persistent HNSW index.
+        self.unchanged = set()
+        # Ids looked up in the corpus before being written, and those of them
+        # stored with different text; a write of any other id may replace a
+        # post that other topics hold too.
+        self.checked = set()
+        self.rewritten = set()
+        self._lock = threading.Lock()
+        self._count = None
+
+    @property
+    def version(self) -> int:
+        # Advances by one for every write that can change this view's posts.
+        return (collection_generation(self.collection.name)
+                + collection_generation(self.collection.name, self.flag))
+
+    def count(self) -> int:
+        # Counting a filtered view means fetching every matching id, so the
+        # result is kept until the next write to the collection.
+        version = self.version
+        cached = self._count
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        count = len(self.get(include=[])["ids"])
+        self._count = (version, count)
+        return count
+
+    def get(self, where: Optional[dict] = None, **kwargs):
+        return self.collection.get(where=_combine(self.where, where), **kwargs)
+
+    def query(self, where: Optional[dict] = None, **kwargs):
+        return self.collection.query(where=_combine(self.where, where), **kwargs)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        indexed_at = time.time()
+        metadatas = [{**(metadata or {}), **self.tags, "indexed_at": indexed_at}
+                     for metadata in (metadatas or [None] * len(ids))]
+        with self._lock:
+            unchanged = [i for i, doc_id in enumerate(ids) if doc_id in self.unchanged]
+            rows = sorted(set(range(len(ids))) - set(unchanged))
+            shared = any(ids[i] not in self.checked or ids[i] in self.rewritten for i in rows)
+        _bump_generation(self.collection.name, None if shared else self.flag)
+        if unchanged:
+            self.collection.update(ids=[ids[i] for i in unchanged], metadatas=[metadatas[i] for i in unchanged])
+        if not rows:
+            return
+        self.collection.upsert(
+            ids=[ids[i] for i in rows],
+            embeddings=[embeddings[i] for i in rows],
+            documents=[documents[i] for i in rows] if documents is not None else None,
+            metadatas=[metadatas[i] for i in rows]
+        )
+
+    def touch(self, ids: Sequence[str]):
+        # Marks entries already in this view as used, keeping them past
+        # compaction; their text and membership don't change.
+        if ids:
+            self.collection.update(ids=list(ids), metadatas=[{**self.tags, "indexed_at": time.time()}] * len(ids))
+
+    def update(self, ids, **kwargs):
+        # Metadata-only updates (e.g. duplicate counts) leave every view's posts as they were.
+        if kwargs.get("documents") is not None:
+            _bump_generation(self.collection.name)
+        self.collection.update(ids=ids, **kwargs)
+
+class CorpusView:
+    # Stands in for a per-analysis Chroma store: the same embeddings, get()
+    # and _collection surface, scoped to one topic and date range of the
+    # shared corpus.
+    def __init__(self, store, topic: str, start_date=None, end_date=None):
+        self.store = store
+        self.embeddings = store.embeddings
+        start_date, end_date = _to_date(start_date), _to_date(end_date)
+        self.spec = {
+            "topic": topic,
+            "start_date": start_date.isoformat() if start_date else None,
+            "end_date": end_date.isoformat() if end_date else None
+        }
+        flag = topic_flag(topic)
+        where = _combine(
+            {flag: True},
+            {"created_utc": {"$gte": _utc_timestamp(start_date)}} if start_date else None,
+            {"created_utc": {"$lt": _utc_timestamp(end_date + timedelta(days=1))}} if end_date else None
+        )
+        name = f"{store._collection.name}/{flag}/{self.spec['start_date']}/{self.spec['end_date']}"
+        self._collection = FilteredCollection(store._collection, name, where, flag)
+
+    def get(self, **kwargs):
+        return self._collection.get(**kwargs)
+
+    def stored_embeddings(self, ids: Sequence[str], texts: Sequence[str]) -> Dict[str, List[float]]:
+        # Posts already in the corpus with unchanged text (e.g. indexed for
+        # another topic) reuse their stored vector instead of being embedded again.
+        expected = dict(zip(ids, texts))
+        if not expected:
+            return {}
+        found = self.store._collection.get(ids=list(expected), include=['documents', 'embeddings'])
+        stored = {
+            doc_id: vector
+            for doc_id, text, vector in zip(found['ids'], found['documents'], found['embeddings'])
+            if expected.get(doc_id) == text
+        }
+        with self._collection._lock:
+            self._collection.unchanged.update(stored)
+            self._collection.checked.update(expected)
+            self._collection.rewritten.update(doc_id for doc_id in found['ids'] if doc_id not in stored)
+        metrics.cache_lookup("corpus", True, len(stored))
+        metrics.cache_lookup("corpus", False, len(expected) - len(stored))
+        return stored
+
+def shares_vector_space(embeddings) -> bool:
+    # A backend fit to one analysis's posts (local IDF) embeds into a space
+    # no other analysis uses, so its posts can't go into the shared corpus.
+    return getattr(embeddings, "fingerprint", None) is None
+
+def corpus_collection_name(embeddings) -> str:
+    # One collection per embedding model, since vectors from different models don't mix.
+    model_name = (getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None)
+                  or type(embeddings).__name__)
+    return CORPUS_COLLECTION_PREFIX + re.sub(r"[^a-zA-Z0-9_-]+", "-", model_name)[:48].strip("-_")
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+def get_corpus(embeddings):
+    name = corpus_collection_name(embeddings)
+    with _corpora_lock:
+        store = _corpora.get(name)
+        if store is None:
+            from langchain_community.vectorstores import Chroma
+            CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+            store = _corpora[name] = Chroma(
+                collection_name=name,
+                embedding_function=embeddings,
+                persist_directory=str(CORPUS_DIR)
+            )
+        return store
+
+def get_corpus_view(embeddings, topic: str, start_date=None, end_date=None) -> CorpusView:
+    return CorpusView(get_corpus(embeddings), topic, start_date, end_date)
+
+def compact_corpus(retention_days: float = CORPUS_RETENTION_DAYS) -> int:
+    # Deletes entries that no analysis has written or restored within the
+    # retention window, across every embedding model's collection, and drops
+    # collections left empty.
+    import chromadb
+    if not CORPUS_DIR.exists():
+        return 0
+    cutoff = time.time() - retention_days * 24 * 60 * 60
+    client = chromadb.PersistentClient(path=str(CORPUS_DIR))
+    deleted = 0
+    for collection in client.list_collections():
+        if not collection.name.startswith(CORPUS_COLLECTION_PREFIX):
+            continue
+        collection = client.get_collection(collection.name)
+        expired = collection.get(where={"indexed_at": {"$lt": cutoff}}, include=[])["ids"]
+        for i in range(0, len(expired), CORPUS_DELETE_BATCH_SIZE):
+            collection.delete(ids=expired[i:i + CORPUS_DELETE_BATCH_SIZE])
+        if expired:
+            _bump_generation(collection.name)
+        deleted += len(expired)
+        if collection.count() == 0:
+            with _corpora_lock:
+                _corpora.pop(collection.name, None)
+                client.delete_collection(collection.name)
+    if deleted:
+        print(f"Corpus compaction removed {deleted} entries older than {retention_days:g} days")
+    metrics.increment("corpus_compacted_total", deleted)
+    return deleted
+
+_last_compacted = 0.0
+_compact_lock = threading.Lock()
+
+def maybe_compact_corpus(interval: float = CORPUS_COMPACT_INTERVAL) -> int:
+    global _last_compacted
+    with _compact_lock:
+        if time.time() - _last_compacted < interval:
+            return 0
+        _last_compacted = time.time()
+    try:
+        with metrics.span("corpus_compact"):
+            return compact_corpus()
+    except Exception as e:
+        print(f"Error compacting corpus: {str(e)}")
+        return 0
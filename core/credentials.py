@@ -0,0 +1,23 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+REQUIRED_CREDENTIALS = {
+    "openai": ("OPENAI_API_KEY",),
+    "reddit": ("REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET"),
+}
+
+_validated = set()
+_validated_lock = threading.Lock()
+
+def require_credentials(service: str):
+    # Checked when a backend is first used rather than at import, so code
+    # paths that never touch a service don't need its keys.
+    with _validated_lock:
+        if service in _validated:
+            return
+        load_dotenv()
+        missing = [var for var in REQUIRED_CREDENTIALS[service] if not os.getenv(var)]
+        if missing:
+            raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
+        _validated.add(service)
@@ -0,0 +1,102 @@
+import re
+import time
+import zlib
+from typing import Iterable, Iterator, Optional, Tuple
+import numpy as np
+
+NUM_PERM = 128
+NUM_BANDS = 16
+SIMILARITY_THRESHOLD = 0.8
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_PATTERN = re.compile(r"\w+")
+
+def _shingle_hashes(text: str, shingle_size: int) -> np.ndarray:
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) > shingle_size:
+        shingles = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+    else:
+        shingles = [" ".join(words)]
+    return np.fromiter((zlib.crc32(shingle.encode()) for shingle in set(shingles)), dtype=np.uint64)
+
+class NearDuplicateIndex:
+    def __init__(self, num_perm: int = NUM_PERM, num_bands: int = NUM_BANDS,
+                 threshold: float = SIMILARITY_THRESHOLD, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        if num_perm % num_bands:
+            raise ValueError("num_perm must be a multiple of num_bands")
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.b = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.rows = num_perm // num_bands
+        self.num_bands = num_bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.signatures = []
+        self.buckets = [{} for _ in range(num_bands)]
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = _shingle_hashes(text, self.shingle_size)
+        # Wrap-around uint64 arithmetic is intended here, as in the usual MinHash construction.
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(self.a, hashes) + self.b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=1)
+
+    def add(self, text: str) -> Optional[int]:
+        signature = self.signature(text)
+        band_keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.num_bands)]
+        checked = set()
+        for band, key in enumerate(band_keys):
+            for candidate in self.buckets[band].get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                    return candidate
+        representative = len(self.signatures)
+        self.signatures.append(signature)
+        for band, key in enumerate(band_keys):
+            self.buckets[band].setdefault(key, []).append(representative)
+        return None
+
+def _split(item, metadata: Optional[dict]) -> Tuple[str, dict]:
+    if isinstance(item, tuple):
+        content, item_metadata = item
+    else:
+        content, item_metadata = item, metadata
+    return content, dict(item_metadata or {})
+
+class NearDuplicateFilter:
+    def __init__(self, index: Optional[NearDuplicateIndex] = None):
+        self.index = index or NearDuplicateIndex()
+        self.representatives = []
+        self.stats = {}
+
+    def filter(self, posts: Iterable, metadata: Optional[dict] = None) -> Iterator[Tuple[str, dict]]:
+        # Yields each cluster's first post as soon as it is seen. Later duplicates
+        # increment duplicate_count on that post's metadata dict in place.
+        seconds = 0.0
+        seen = 0
+        try:
+            for item in posts:
+                seen += 1
+                content, item_metadata = _split(item, metadata)
+                started = time.perf_counter()
+                representative = self.index.add(content)
+                seconds += time.perf_counter() - started
+                if representative is not None:
+                    self.representatives[representative][1]["duplicate_count"] += 1
+                    continue
+                item_metadata["duplicate_count"] = 0
+                self.representatives.append((content, item_metadata))
+                yield content, item_metadata
+        finally:
+            kept = len(self.representatives)
+            self.stats.update({
+                "input": seen,
+                "kept": kept,
+                "duplicates": seen - kept,
+                "duplicate_ratio": (seen - kept) / seen if seen else 0.0,
+                "seconds": seconds
+            })
@@ -0,0 +1,128 @@
+import hashlib
+import re
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from core.credentials import require_credentials
+
+LOCAL_MODEL_DIR = Path("data/.cache/models")
+LOCAL_EMBEDDING_DIM = 384
+LOCAL_IDF_BUCKETS = 1 << 20
+LOCAL_PROJECTIONS = 4
+# Each fitted model's IDF table is ~4 MB; the least recently used are deleted.
+LOCAL_MODEL_MAX_FILES = 16
+DEFAULT_EMBEDDING_BACKEND = "openai"
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_PRIME = np.uint64((1 << 61) - 1)
+
+class LocalHashingEmbeddings(Embeddings):
+    # Feature-hashed unigrams and bigrams with sublinear TF and optional
+    # corpus IDF, reduced to `dim` with a seeded sparse random projection:
+    # each feature lands in LOCAL_PROJECTIONS signed output dimensions.
+    # Computed in-process, so not worth storing in the embedding cache.
+    cacheable = False
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM, idf: Optional[np.ndarray] = None, seed: int = 7):
+        self.dim = dim
+        self.idf = idf
+        rng = np.random.RandomState(seed)
+        self._index_a = rng.randint(1, 1 << 31, size=LOCAL_PROJECTIONS).astype(np.uint64)
+        self._index_b = rng.randint(0, 1 << 31, size=LOCAL_PROJECTIONS).astype(np.uint64)
+        self._sign_a = rng.randint(1, 1 << 31, size=LOCAL_PROJECTIONS).astype(np.uint64)
+        self._sign_b = rng.randint(0, 1 << 31, size=LOCAL_PROJECTIONS).astype(np.uint64)
+        self.fingerprint = hashlib.sha256(idf.tobytes()).hexdigest()[:16] if idf is not None else None
+        self.model = f"local-hash-{dim}" + (f"-{self.fingerprint}" if self.fingerprint else "")
+
+    @staticmethod
+    def _feature_hashes(text: str) -> np.ndarray:
+        words = _TOKEN_PATTERN.findall(text.lower())
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return np.fromiter((zlib.crc32(term.encode()) for term in terms), dtype=np.uint64, count=len(terms))
+
+    def _embed(self, text: str) -> List[float]:
+        features, counts = np.unique(self._feature_hashes(text), return_counts=True)
+        if features.size == 0:
+            return [0.0] * self.dim
+        weights = 1.0 + np.log(counts)
+        if self.idf is not None:
+            weights = weights * self.idf[features % LOCAL_IDF_BUCKETS]
+        indices = (np.outer(self._index_a, features) + self._index_b[:, None]) % _PRIME % np.uint64(self.dim)
+        signs = np.where((np.outer(self._sign_a, features) + self._sign_b[:, None]) % _PRIME & np.uint64(1), 1.0, -1.0)
+        vector = np.bincount(indices.ravel().astype(np.int64), (signs * weights).ravel(), minlength=self.dim)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def fit(self, texts: List[str]) -> "LocalHashingEmbeddings":
+        document_frequency = np.zeros(LOCAL_IDF_BUCKETS, dtype=np.int32)
+        for text in texts:
+            buckets = np.unique(self._feature_hashes(text) % LOCAL_IDF_BUCKETS).astype(np.int64)
+            document_frequency[buckets] += 1
+        idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        fitted = LocalHashingEmbeddings(self.dim, idf)
+        try:
+            LOCAL_MODEL_DIR.mkdir(parents=True, exist_ok=True)
+            model_file = LOCAL_MODEL_DIR / f"{fitted.model}.npy"
+            if not model_file.exists():
+                temp_file = model_file.with_suffix('.tmp')
+                with open(temp_file, 'wb') as f:
+                    np.save(f, idf)
+                temp_file.rename(model_file)
+            _evict_local_models()
+        except Exception as e:
+            print(f"Error saving local embedding model: {str(e)}")
+        return fitted
+
+def _evict_local_models(max_files: int = LOCAL_MODEL_MAX_FILES):
+    # Model files are touched when restored, so mtime order is LRU order. A
+    # cached analysis whose model was evicted fails to restore and is recomputed.
+    model_files = sorted(LOCAL_MODEL_DIR.glob("local-hash-*.npy"), key=lambda path: path.stat().st_mtime)
+    for model_file in model_files[:max(0, len(model_files) - max_files)]:
+        try:
+            model_file.unlink()
+        except FileNotFoundError:
+            pass
+
+def _openai_embeddings() -> Embeddings:
+    require_credentials("openai")
+    from langchain_community.embeddings import OpenAIEmbeddings
+    return OpenAIEmbeddings()
+
+EMBEDDING_BACKENDS: Dict[str, Callable[[], Embeddings]] = {
+    "openai": _openai_embeddings,
+    "local": LocalHashingEmbeddings,
+}
+
+def get_embedding_backend(name: str = DEFAULT_EMBEDDING_BACKEND) -> Embeddings:
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    return EMBEDDING_BACKENDS[name]()
+
+def fit_embedding_backend(embeddings: Embeddings, texts: List[str]) -> Embeddings:
+    if hasattr(embeddings, "fit"):
+        return embeddings.fit(texts)
+    return embeddings
+
+def restore_embedding_backend(model_name: Optional[str]) -> Embeddings:
+    # Rebuild the backend a cached store was embedded with, so queries land
+    # in the same vector space.
+    if not model_name or not model_name.startswith("local-hash-"):
+        return get_embedding_backend("openai")
+    parts = model_name.split("-")
+    dim = int(parts[2])
+    if len(parts) == 3:
+        return LocalHashingEmbeddings(dim)
+    model_file = LOCAL_MODEL_DIR / f"{model_name}.npy"
+    idf = np.load(model_file)
+    model_file.touch()
+    return LocalHashingEmbeddings(dim, idf)
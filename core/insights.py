@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from typing import List
+import numpy as np
+from langchain_core.prompts import PromptTemplate
+from core.chat_backends import get_chat_model, CHAT_MODEL
+from core.tokens import count_tokens, truncate_to_tokens
+from core import metrics
+
+MAP_BATCH_TOKENS = 6000
+REDUCE_BATCH_TOKENS = 6000
+MAX_CONCURRENCY = 4
+SOURCES_PER_INSIGHT = 3
+
+INSIGHTS_PROMPT = PromptTemplate(
+    input_variables=["text"],
+    template="""Analyze the following text and provide 5 key insights about the topic. Each insight should be concise, meaningful, and highlight important trends or patterns:\n        {text}\n\n        Format the response as a list of bullet points, with each point on a new line starting with a dash (-). Focus on extracting meaningful insights rather than just summarizing the content."""
+)
+
+REDUCE_PROMPT = PromptTemplate(
+    input_variables=["text"],
+    template="""The following bullet points are key insights extracted from different batches of posts about the same topic. Merge them into the 5 most important insights overall, combining duplicates and keeping the ones best supported across batches:\n        {text}\n\n        Format the response as a list of bullet points, with each point on a new line starting with a dash (-)."""
+)
+
+def split_into_batches(texts: List[str], max_tokens: int) -> List[str]:
+    batches = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if tokens > max_tokens:
+            text = truncate_to_tokens(text, max_tokens)
+            tokens = max_tokens
+        if current and current_tokens + tokens > max_tokens:
+            batches.append("\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        batches.append("\n".join(current))
+    return batches
+
+def parse_insights(text: str) -> List[str]:
+    return [point.strip('- ').strip() for point in text.split('\n') if point.strip()]
+
+def _run_chain(chain: "LLMChain", text: str) -> str:
+    with metrics.span("llm_call"):
+        output = chain.run(text=text)
+    metrics.external_call("llm", tokens_in=count_tokens(chain.prompt.format(text=text)), tokens_out=count_tokens(output))
+    return output
+
+def _run_concurrently(chain: "LLMChain", batches: List[str], max_concurrency: int) -> List[str]:
+    if len(batches) == 1:
+        return [_run_chain(chain, batches[0])]
+    run_chain = metrics.propagate(_run_chain)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(batches)))) as executor:
+        return list(executor.map(lambda batch: run_chain(chain, batch), batches))
+
+def generate_insights(texts: List[str], llm=None, map_batch_tokens: int = MAP_BATCH_TOKENS,
+                      reduce_batch_tokens: int = REDUCE_BATCH_TOKENS,
+                      max_concurrency: int = MAX_CONCURRENCY) -> List[str]:
+    from langchain.chains import LLMChain
+    llm = llm or get_chat_model(CHAT_MODEL, temperature=0.7)
+    map_chain = LLMChain(llm=llm, prompt=INSIGHTS_PROMPT)
+    batches = split_into_batches(texts, map_batch_tokens)
+    if not batches:
+        return []
+    partials = _run_concurrently(map_chain, batches, max_concurrency)
+    if len(partials) == 1:
+        return parse_insights(partials[0])
+    reduce_chain = LLMChain(llm=llm, prompt=REDUCE_PROMPT)
+    # Reduce in rounds until the partial insights fit in a single call.
+    while len(partials) > 1:
+        parsed = [[f"- {point}" for point in parse_insights(partial)] for partial in partials]
+        batches = split_into_batches([point for points in parsed for point in points], reduce_batch_tokens)
+        if len(batches) >= len(partials):
+            # The round didn't shrink, so finish in one bounded call: each
+            # partial lists its most important points first, so take points
+            # rank by rank across partials and drop those that don't fit.
+            ranked = [point for rank in zip_longest(*parsed) for point in rank if point is not None]
+            batches = split_into_batches(ranked, reduce_batch_tokens)[:1]
+        partials = _run_concurrently(reduce_chain, batches, max_concurrency)
+    return parse_insights(partials[0])
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def attribute_insights(insights: List[str], vector_store, embeddings, k: int = SOURCES_PER_INSIGHT) -> List[List[dict]]:
+    if not insights:
+        return []
+    store_data = vector_store.get(include=['embeddings', 'metadatas'])
+    if not store_data or store_data.get('embeddings') is None or len(store_data['embeddings']) == 0:
+        return [[] for _ in insights]
+    corpus = _normalize_rows(np.asarray(store_data['embeddings'], dtype=np.float32))
+    queries = _normalize_rows(np.asarray(embeddings.embed_documents(insights), dtype=np.float32))
+    scores = queries @ corpus.T
+    # Over-fetch so several chunks of one post still leave k distinct posts.
+    fetch_k = min(k * 4, corpus.shape[0])
+    top = np.argpartition(-scores, fetch_k - 1, axis=1)[:, :fetch_k]
+    sources = []
+    for row, candidates in enumerate(top):
+        ranked = candidates[np.argsort(-scores[row, candidates])]
+        insight_sources = []
+        seen_parents = set()
+        for index in ranked:
+            metadata = store_data['metadatas'][index] or {}
+            parent_id = metadata.get("parent_id") or store_data['ids'][index]
+            if parent_id in seen_parents:
+                continue
+            if len(insight_sources) >= k:
+                break
+            seen_parents.add(parent_id)
+            insight_sources.append({
+                "url": metadata.get("url", ""),
+                "score": float(scores[row, index]),
+                "id": parent_id
+            })
+        sources.append(insight_sources)
+    return sources
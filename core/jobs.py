@@ -0,0 +1,156 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+MAX_ANALYSIS_WORKERS = 4
+FINISHED_JOB_TTL = 60 * 60
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, key: str, description: str = ""):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.description = description
+        self.status = QUEUED
+        self.stage = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        # Sessions waiting on this job; coalesced submits share one job.
+        self.subscribers = 1
+        self._cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def report(self, stage: str, progress: float, message: str = ""):
+        self.check_cancelled()
+        self.stage = stage
+        self.progress = max(self.progress, min(progress, 1.0))
+        self.message = message
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        self._cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.finish(CANCELLED)
+
+    def finish(self, status: str):
+        # finished_at is set first so a finished job always has it.
+        self.finished_at = time.time()
+        self.status = status
+
+    def snapshot(self) -> dict:
+        return {
+            "id": self.id,
+            "key": self.key,
+            "description": self.description,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "elapsed": (self.finished_at or time.time()) - self.created_at
+        }
+
+class JobManager:
+    def __init__(self, max_workers: int = MAX_ANALYSIS_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._jobs: Dict[str, Job] = {}
+        self._in_flight: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable[[Job], object], description: str = "") -> Job:
+        with self._lock:
+            self._prune()
+            job = self._in_flight.get(key)
+            if job is not None and not job.finished and not job.cancel_requested:
+                job.subscribers += 1
+                return job
+            job = Job(key, description)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+            job.future = self._executor.submit(self._run, job, fn)
+        # Also covers a future cancelled before _run started.
+        job.future.add_done_callback(lambda future: self._release(job))
+        return job
+
+    def _release(self, job: Job):
+        with self._lock:
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+
+    def _run(self, job: Job, fn: Callable[[Job], object]):
+        job.status = RUNNING
+        try:
+            job.check_cancelled()
+            job.result = fn(job)
+            job.stage = "done"
+            job.progress = 1.0
+            job.finish(DONE)
+        except JobCancelled:
+            job.finish(CANCELLED)
+        except Exception as e:
+            print(f"Error running job {job.id}: {str(e)}")
+            job.error = str(e)
+            job.finish(FAILED)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        # Drops the caller's subscription; the job itself is only cancelled
+        # once no other session is waiting on it.
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job.subscribers -= 1
+            if job.subscribers > 0:
+                return True
+        job.cancel()
+        return True
+
+    def list_jobs(self) -> list:
+        with self._lock:
+            return [job.snapshot() for job in self._jobs.values()]
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at is not None and now - job.finished_at > FINISHED_JOB_TTL]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+def get_job_manager() -> JobManager:
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager()
+        return _job_manager
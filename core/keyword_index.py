@@ -0,0 +1,188 @@
+import math
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Sequence, Tuple
+import numpy as np
+from core.trend_signals import TOKEN_PATTERN
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+KEYWORD_INDEX_MAX_COLLECTIONS = 16
+INDEX_LOAD_BATCH_SIZE = 5000
+
+def keyword_terms(text: str) -> List[str]:
+    # No stopword list: BM25's idf already gives near-zero weight to words
+    # that appear everywhere, and short exact terms (tickers) must survive.
+    return TOKEN_PATTERN.findall(text.lower())
+
+class KeywordIndex:
+    # In-memory inverted index with BM25 scoring over the documents of one
+    # vector store collection, keyed by the same ids as the collection.
+    # Documents get dense integer numbers and postings are append-only
+    # uint32 arrays (a few bytes per term occurrence instead of a dict entry);
+    # an upserted document is tombstoned and compacted away later.
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.ids: List[str] = []
+        self.numbers: Dict[str, int] = {}
+        self.lengths = array('I')
+        self.live = bytearray()
+        self.total_length = 0
+        # Write version of the collection this index reflects, for
+        # collections that track one (corpus views); None otherwise.
+        self.version = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def _remove(self, doc_id: str):
+        number = self.numbers.pop(doc_id, None)
+        if number is None:
+            return
+        self.live[number] = 0
+        self.total_length -= self.lengths[number]
+
+    def _compact(self):
+        keep = [number for number in range(len(self.ids)) if self.live[number]]
+        renumber = {old: new for new, old in enumerate(keep)}
+        postings = {}
+        for term, (docs, frequencies) in self.postings.items():
+            new_docs, new_frequencies = array('I'), array('I')
+            for number, frequency in zip(docs, frequencies):
+                if number in renumber:
+                    new_docs.append(renumber[number])
+                    new_frequencies.append(frequency)
+            if new_docs:
+                postings[term] = (new_docs, new_frequencies)
+        self.postings = postings
+        self.ids = [self.ids[number] for number in keep]
+        self.numbers = {doc_id: number for number, doc_id in enumerate(self.ids)}
+        self.lengths = array('I', (self.lengths[number] for number in keep))
+        self.live = bytearray(b"\x01" * len(keep))
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]):
+        # Upsert semantics, matching the collection: re-adding an id replaces it.
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                doc_id = str(doc_id)
+                self._remove(doc_id)
+                terms = Counter(keyword_terms(text or ""))
+                number = len(self.ids)
+                self.ids.append(doc_id)
+                self.numbers[doc_id] = number
+                self.lengths.append(sum(terms.values()))
+                self.live.append(1)
+                self.total_length += self.lengths[number]
+                for term, count in terms.items():
+                    docs, frequencies = self.postings.setdefault(term, (array('I'), array('I')))
+                    docs.append(number)
+                    frequencies.append(count)
+            if len(self.ids) > 2 * len(self.numbers) + 1000:
+                self._compact()
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(str(doc_id))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        with self._lock:
+            doc_count = len(self.numbers)
+            if not doc_count:
+                return []
+            average_length = self.total_length / doc_count or 1
+            live = np.frombuffer(self.live, dtype=np.uint8).astype(bool)
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float64)
+            scores = np.zeros(len(self.ids))
+            for term in set(keyword_terms(query)):
+                if term not in self.postings:
+                    continue
+                docs, frequencies = self.postings[term]
+                docs = np.frombuffer(docs, dtype=np.uint32)
+                frequencies = np.frombuffer(frequencies, dtype=np.uint32).astype(np.float64)
+                mask = live[docs]
+                docs, frequencies = docs[mask], frequencies[mask]
+                if not len(docs):
+                    continue
+                idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[docs] / average_length)
+                scores[docs] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+            matched = np.flatnonzero(scores)
+            if len(matched) > k:
+                matched = matched[np.argpartition(scores[matched], -k)[-k:]]
+            ranked = matched[np.argsort(-scores[matched], kind="stable")]
+            return [(self.ids[number], float(scores[number])) for number in ranked]
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = RRF_K) -> List[str]:
+    # Each ranking is a best-first list of ids; ids ranked well by several
+    # retrievers rise to the top without having to compare raw scores.
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def _collection_key(vector_store) -> str:
+    return vector_store._collection.name
+
+def _collection_version(vector_store):
+    # Shared corpus views can also change through writes made by other views
+    # of the same collection, so they count the writes that can affect them;
+    # per-analysis collections are only written through index_documents' callers.
+    return getattr(vector_store._collection, "version", None)
+
+def _build_index(vector_store) -> KeywordIndex:
+    index = KeywordIndex()
+    index.version = _collection_version(vector_store)
+    total = vector_store._collection.count()
+    for offset in range(0, total, INDEX_LOAD_BATCH_SIZE):
+        batch = vector_store._collection.get(include=['documents'], limit=INDEX_LOAD_BATCH_SIZE, offset=offset)
+        index.add(batch['ids'], batch['documents'])
+    return index
+
+def get_keyword_index(vector_store) -> KeywordIndex:
+    # Indexes are kept for the most recently used collections. One that was
+    # evicted, or whose collection has been written since, is rebuilt from
+    # the stored documents without any embedding calls.
+    key = _collection_key(vector_store)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+    if index is not None and index.version == _collection_version(vector_store):
+        return index
+    index = _build_index(vector_store)
+    with _indexes_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > KEYWORD_INDEX_MAX_COLLECTIONS:
+            _indexes.popitem(last=False)
+    return index
+
+def index_documents(vector_store, ids: Sequence[str], texts: Sequence[str]):
+    # Called right after documents are upserted into the collection. The
+    # index stays current only if that upsert was the single write since it
+    # was last current; otherwise it is left stale and rebuilt on next use.
+    key = _collection_key(vector_store)
+    version = _collection_version(vector_store)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = KeywordIndex()
+            # A view may already hold documents written by other analyses.
+            index.version = None if version is None else -1
+        _indexes.move_to_end(key)
+        while len(_indexes) > KEYWORD_INDEX_MAX_COLLECTIONS:
+            _indexes.popitem(last=False)
+    index.add(ids, texts)
+    with index._lock:
+        if version is not None and index.version == version - 1:
+            index.version = version
@@ -0,0 +1,234 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+METRIC_PREFIX = "trend_analyzer"
+PROMETHEUS_PATH = Path("data/.cache/metrics.prom")
+# Structured JSON log of spans and finished traces; "-" logs to stderr and an
+# empty value turns it off.
+METRICS_LOG_PATH = os.getenv("TREND_METRICS_LOG", "data/.cache/metrics.jsonl")
+# The file log rolls over at this size, keeping METRICS_LOG_BACKUPS old files.
+METRICS_LOG_MAX_BYTES = int(os.getenv("TREND_METRICS_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+METRICS_LOG_BACKUPS = 3
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_current_trace = contextvars.ContextVar("trend_analyzer_trace", default=None)
+_logger = logging.getLogger("trend_analyzer.metrics")
+_logger_lock = threading.Lock()
+_logger_configured = False
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+class MetricsRegistry:
+    # Process-wide totals since startup, exported in Prometheus text format.
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: float = 1, labels: Optional[dict] = None):
+        key = (name, _labels_key(labels or {}))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, labels: Optional[dict] = None):
+        key = (name, _labels_key(labels or {}))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value["buckets"]))) for key, value in self.histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+        for (name, labels), histogram in histograms:
+            metric = f"{METRIC_PREFIX}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{metric}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+class Trace:
+    # Per-analysis breakdown. Stages can overlap (fetching, embedding and
+    # indexing run concurrently), so stage seconds need not sum to the total.
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.started = time.time()
+        self.finished = None
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage: str, seconds: float):
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def add_counter(self, key: str, amount: float):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = [
+                {"stage": stage, "seconds": round(seconds, 4), "count": count}
+                for stage, (seconds, count) in sorted(self.stages.items(), key=lambda item: -item[1][0])
+            ]
+            counters = dict(sorted(self.counters.items()))
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "total_seconds": round((self.finished or time.time()) - self.started, 4),
+            "stages": stages,
+            "counters": counters
+        }
+
+registry = MetricsRegistry()
+
+def _configure_logger():
+    global _logger_configured
+    with _logger_lock:
+        if _logger_configured:
+            return
+        _logger_configured = True
+        _logger.propagate = False
+        _logger.setLevel(logging.INFO)
+        if not METRICS_LOG_PATH:
+            _logger.addHandler(logging.NullHandler())
+            return
+        try:
+            if METRICS_LOG_PATH == "-":
+                handler = logging.StreamHandler(sys.stderr)
+            else:
+                Path(METRICS_LOG_PATH).parent.mkdir(parents=True, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    METRICS_LOG_PATH, maxBytes=METRICS_LOG_MAX_BYTES, backupCount=METRICS_LOG_BACKUPS
+                )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _logger.addHandler(handler)
+        except Exception as e:
+            print(f"Error opening metrics log: {str(e)}")
+            _logger.addHandler(logging.NullHandler())
+
+def log_event(event: str, **fields):
+    _configure_logger()
+    current = _current_trace.get()
+    record = {"ts": round(time.time(), 3), "event": event}
+    if current is not None:
+        record["trace_id"] = current.id
+    record.update(fields)
+    _logger.info(json.dumps(record, default=str))
+
+def _counter_key(name: str, labels: dict) -> str:
+    return ".".join([name] + [str(value) for _, value in sorted(labels.items())])
+
+def increment(name: str, amount: float = 1, **labels):
+    registry.increment(name, amount, labels)
+    current = _current_trace.get()
+    if current is not None:
+        current.add_counter(_counter_key(name, labels), amount)
+
+def external_call(service: str, tokens_in: int = 0, tokens_out: int = 0):
+    increment("external_calls_total", service=service)
+    if tokens_in:
+        increment("tokens_total", tokens_in, service=service, direction="in")
+    if tokens_out:
+        increment("tokens_total", tokens_out, service=service, direction="out")
+
+def cache_lookup(cache: str, hit: bool, count: int = 1):
+    if count:
+        increment("cache_requests_total", count, cache=cache, result="hit" if hit else "miss")
+
+def record_duration(stage: str, seconds: float, **labels):
+    registry.observe("stage_seconds", seconds, {"stage": stage, **labels})
+    current = _current_trace.get()
+    if current is not None:
+        current.add_span(stage, seconds)
+    log_event("span", stage=stage, seconds=round(seconds, 6), **labels)
+
+@contextmanager
+def span(stage: str, **labels) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_duration(stage, time.perf_counter() - started, **labels)
+
+@contextmanager
+def trace(name: str) -> Iterator[Trace]:
+    current = Trace(name)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        current.finished = time.time()
+        _current_trace.reset(token)
+        log_event("trace", **current.summary())
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def propagate(fn):
+    # Worker threads do not inherit context variables, so bind the caller's
+    # trace into functions handed to threads and executors.
+    bound = _current_trace.get()
+
+    def run(*args, **kwargs):
+        token = _current_trace.set(bound)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_trace.reset(token)
+    return run
+
+def prometheus_text() -> str:
+    return registry.prometheus_text()
+
+def write_prometheus_textfile(path: Path = PROMETHEUS_PATH):
+    # For node_exporter's textfile collector; Streamlit has no route to scrape.
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = path.with_suffix('.tmp')
+        temp_file.write_text(prometheus_text())
+        temp_file.replace(path)
+    except Exception as e:
+        print(f"Error writing metrics: {str(e)}")
@@ -0,0 +1,168 @@
+import queue
+import threading
+import uuid
+from typing import Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_community.vectorstores import Chroma
+from core.tokens import count_tokens
+from core.keyword_index import index_documents
+from core import metrics
+
+EMBED_BATCH_SIZE = 64
+EMBED_BATCH_TOKENS = 50_000
+QUEUE_SIZE = 8
+EMBED_WORKERS = 2
+
+_DONE = object()
+
+class _Pipeline:
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.errors = []
+
+    def put(self, q: queue.Queue, item) -> bool:
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q: queue.Queue):
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fail(self, error: Exception):
+        self.errors.append(error)
+        self.stop_event.set()
+
+def _to_document(item, metadata: Optional[dict], clean_metadata) -> Document:
+    if isinstance(item, tuple):
+        content, doc_metadata = item
+    else:
+        content, doc_metadata = item, metadata
+    return Document(page_content=content, metadata=clean_metadata(doc_metadata or {}))
+
+def _ingest(pipeline: _Pipeline, posts: Iterable, metadata: Optional[dict], clean_metadata,
+            batch_size: int, batch_tokens: int, out: queue.Queue, embed_workers: int):
+    try:
+        batch = []
+        tokens = 0
+        for item in posts:
+            if pipeline.stop_event.is_set():
+                return
+            doc = _to_document(item, metadata, clean_metadata)
+            doc_tokens = doc.metadata.get("token_count") or count_tokens(doc.page_content)
+            if batch and tokens + doc_tokens > batch_tokens:
+                if not pipeline.put(out, batch):
+                    return
+                batch = []
+                tokens = 0
+            batch.append(doc)
+            tokens += doc_tokens
+            if len(batch) >= batch_size:
+                if not pipeline.put(out, batch):
+                    return
+                batch = []
+                tokens = 0
+        if batch:
+            pipeline.put(out, batch)
+    except Exception as e:
+        pipeline.fail(e)
+    finally:
+        for _ in range(embed_workers):
+            pipeline.put(out, _DONE)
+
+def _doc_id(doc: Document) -> Optional[str]:
+    return str(doc.metadata["id"]) if doc.metadata.get("id") else None
+
+def _embed_batch(embeddings, batch: List[Document], reuse=None) -> list:
+    # reuse(ids, texts) returns vectors the store already holds for unchanged documents.
+    stored = {}
+    if reuse is not None:
+        known = [doc for doc in batch if _doc_id(doc)]
+        stored = reuse([_doc_id(doc) for doc in known], [doc.page_content for doc in known])
+    missing = [doc.page_content for doc in batch if _doc_id(doc) not in stored]
+    embedded = iter(embeddings.embed_documents(missing) if missing else [])
+    return [stored[_doc_id(doc)] if _doc_id(doc) in stored else next(embedded) for doc in batch]
+
+def _embed(pipeline: _Pipeline, embeddings, source: queue.Queue, out: queue.Queue, reuse=None):
+    try:
+        while True:
+            batch = pipeline.get(source)
+            if batch is _DONE:
+                return
+            with metrics.span("embed"):
+                vectors = _embed_batch(embeddings, batch, reuse)
+            if not pipeline.put(out, (batch, vectors)):
+                return
+    except Exception as e:
+        pipeline.fail(e)
+    finally:
+        pipeline.put(out, _DONE)
+
+def stream_into_vector_store(posts: Iterable, embeddings, metadata: Optional[dict] = None, clean_metadata=dict,
+                             batch_size: int = EMBED_BATCH_SIZE, batch_tokens: int = EMBED_BATCH_TOKENS,
+                             queue_size: int = QUEUE_SIZE,
+                             embed_workers: int = EMBED_WORKERS,
+                             collection_name: Optional[str] = None,
+                             vector_store=None) -> Tuple[Chroma, List[Document]]:
+    # vector_store may be an existing store or corpus view to index into;
+    # by default each call gets a fresh in-memory collection.
+    pipeline = _Pipeline()
+    batches = queue.Queue(maxsize=queue_size)
+    embedded = queue.Queue(maxsize=queue_size)
+    if vector_store is None:
+        vector_store = Chroma(
+            collection_name=collection_name or f"analysis_{uuid.uuid4().hex}",
+            embedding_function=embeddings
+        )
+    reuse = getattr(vector_store, "stored_embeddings", None)
+    threads = [threading.Thread(
+        target=metrics.propagate(_ingest),
+        args=(pipeline, posts, metadata, clean_metadata, batch_size, batch_tokens, batches, embed_workers),
+        daemon=True
+    )]
+    threads += [
+        threading.Thread(target=metrics.propagate(_embed), args=(pipeline, embeddings, batches, embedded, reuse), daemon=True)
+        for _ in range(embed_workers)
+    ]
+    for thread in threads:
+        thread.start()
+    documents = []
+    finished = 0
+    try:
+        # Index on the calling thread while fetching and embedding continue upstream.
+        while finished < embed_workers:
+            item = pipeline.get(embedded)
+            if item is _DONE:
+                if pipeline.stop_event.is_set():
+                    break
+                finished += 1
+                continue
+            batch, vectors = item
+            ids = [str(doc.metadata.get("id") or uuid.uuid4().hex) for doc in batch]
+            texts = [doc.page_content for doc in batch]
+            with metrics.span("index"):
+                vector_store._collection.upsert(
+                    ids=ids,
+                    embeddings=[list(vector) for vector in vectors],
+                    documents=texts,
+                    metadatas=[doc.metadata or None for doc in batch]
+                )
+                index_documents(vector_store, ids, texts)
+            documents.extend(batch)
+    except Exception as e:
+        pipeline.fail(e)
+    finally:
+        pipeline.stop_event.set()
+        for thread in threads:
+            thread.join(timeout=1)
+    if pipeline.errors:
+        raise pipeline.errors[0]
+    return vector_store, documents
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional
+from core import metrics
+
+POST_CACHE_DIR = Path("data/.cache/posts")
+TODAY_SHARD_TTL = 15 * 60
+
+def _shard_dir(topic: str, source: str) -> Path:
+    key_str = f"{topic.strip().lower()}_{source}"
+    return POST_CACHE_DIR / hashlib.md5(key_str.encode()).hexdigest()
+
+def _shard_file(topic: str, source: str, day: date) -> Path:
+    return _shard_dir(topic, source) / f"{day.isoformat()}.json"
+
+def _post_day(metadata: dict) -> Optional[date]:
+    created_utc = metadata.get("created_utc")
+    if created_utc is None:
+        return None
+    return datetime.utcfromtimestamp(float(created_utc)).date()
+
+def _day_end(day: date) -> float:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() + 24 * 60 * 60
+
+def read_shard(topic: str, source: str, day: date, max_posts: int) -> Optional[list]:
+    shard_file = _shard_file(topic, source, day)
+    if not shard_file.exists():
+        return None
+    try:
+        with open(shard_file, 'r') as f:
+            data = json.load(f)
+        if data.get('max_posts', 0) < max_posts:
+            return None
+        # A shard fetched before its day was over misses the posts made after
+        # it, so it only stands in for that day for a short while.
+        fetched_at = data.get('fetched_at', 0)
+        day_ended = data.get('day_ended', fetched_at >= _day_end(day))
+        if not day_ended and time.time() - fetched_at > TODAY_SHARD_TTL:
+            return None
+        return [(post['content'], post['metadata']) for post in data['posts']]
+    except Exception as e:
+        print(f"Error reading post shard: {str(e)}")
+        return None
+
+def write_shard(topic: str, source: str, day: date, posts: list, max_posts: int):
+    if day > datetime.utcnow().date():
+        return
+    shard_file = _shard_file(topic, source, day)
+    temp_file = shard_file.with_suffix('.tmp')
+    try:
+        shard_file.parent.mkdir(parents=True, exist_ok=True)
+        fetched_at = time.time()
+        data = {
+            'topic': topic,
+            'source': source,
+            'day': day.isoformat(),
+            'fetched_at': fetched_at,
+            'day_ended': fetched_at >= _day_end(day),
+            'max_posts': max_posts,
+            'posts': [{'content': content, 'metadata': metadata} for content, metadata in posts]
+        }
+        with open(temp_file, 'w') as f:
+            json.dump(data, f)
+        temp_file.rename(shard_file)
+    except Exception as e:
+        print(f"Error writing post shard: {str(e)}")
+        try:
+            temp_file.unlink()
+        except:
+            pass
+
+def _missing_ranges(days: List[date], cached: dict) -> List[tuple]:
+    ranges = []
+    run_start = None
+    previous = None
+    for day in days:
+        if day in cached:
+            if run_start is not None:
+                ranges.append((run_start, previous))
+                run_start = None
+        elif run_start is None:
+            run_start = day
+        previous = day
+    if run_start is not None:
+        ranges.append((run_start, previous))
+    return ranges
+
+def _complete_days(days: List[date], posts: list, fetch_stats: dict, newest_first: bool) -> List[date]:
+    # A walk that reached the end of its range saw every post in it. One that
+    # stopped at the cap only covers, when it walks newest first, the days
+    # after the oldest post it returned; that day may be partial and older
+    # days were never reached. A walk cut short by an error proves nothing.
+    if fetch_stats.get("exhausted"):
+        return days
+    if not (newest_first and fetch_stats.get("capped")):
+        return []
+    post_days = [day for day in (_post_day(metadata) for _, metadata in posts) if day is not None]
+    if not post_days:
+        return []
+    oldest = min(post_days)
+    return [day for day in days if day > oldest]
+
+def iter_posts_for_range(topic: str, source: str, start_date: date, end_date: date,
+                         fetch_posts: Callable[[date, date, dict], Iterable], max_posts: int = 100,
+                         newest_first: bool = True) -> Iterator[tuple]:
+    # Yields posts day by day, newest first: cached days straight from their
+    # shards, missing ranges as fetch_posts streams them, so processing
+    # overlaps the fetch. A range's shards are written once its walk ends.
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    cached = {}
+    for day in days:
+        posts = read_shard(topic, source, day, max_posts)
+        if posts is not None:
+            cached[day] = posts
+    metrics.cache_lookup("posts", True, len(cached))
+    metrics.cache_lookup("posts", False, len(days) - len(cached))
+    missing = {range_end: range_start for range_start, range_end in _missing_ranges(days, cached)}
+    seen_ids = set()
+    yielded = 0
+
+    def is_new(metadata: dict) -> bool:
+        post_id = metadata.get("id")
+        if post_id is None:
+            return True
+        if post_id in seen_ids:
+            return False
+        seen_ids.add(post_id)
+        return True
+
+    for day in reversed(days):
+        if yielded >= max_posts:
+            return
+        if day in cached:
+            for content, metadata in cached[day]:
+                if is_new(metadata):
+                    yield content, metadata
+                    yielded += 1
+                    if yielded >= max_posts:
+                        return
+            continue
+        if day not in missing:
+            continue
+        range_start, range_end = missing[day], day
+        fetched = {missing_day: [] for missing_day in days if range_start <= missing_day <= range_end}
+        # fetch_posts reports in fetch_stats whether its walk was exhausted
+        # or capped; without either, no day it covered is persisted.
+        fetch_stats = {}
+        posts = iter(fetch_posts(range_start, range_end, fetch_stats))
+        try:
+            for content, metadata in posts:
+                post_day = _post_day(metadata)
+                if post_day in fetched:
+                    fetched[post_day].append((content, metadata))
+                if is_new(metadata):
+                    yield content, metadata
+                    yielded += 1
+                    if yielded >= max_posts:
+                        # Stopping here caps the walk just as its own limit would.
+                        if not fetch_stats.get("exhausted"):
+                            fetch_stats["capped"] = True
+                        break
+        finally:
+            if hasattr(posts, "close"):
+                posts.close()
+        range_posts = [post for day_posts in fetched.values() for post in day_posts]
+        for complete_day in _complete_days(list(fetched), range_posts, fetch_stats, newest_first):
+            write_shard(topic, source, complete_day, fetched[complete_day], max_posts)
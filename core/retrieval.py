@@ -0,0 +1,17 @@
+from typing import Any, List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from core.text_processor import get_similar_chunks, DEFAULT_RETRIEVAL_MODE
+
+class ParentFoldingRetriever(BaseRetriever):
+    vector_store: Any
+    k: int = 4
+    mode: str = DEFAULT_RETRIEVAL_MODE
+    # Latency of the most recent query per retrieval path, for reporting.
+    last_timings: dict = {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        timings = {}
+        documents = get_similar_chunks(self.vector_store, query, self.k, mode=self.mode, timings=timings)
+        self.last_timings = timings
+        return documents
@@ -1,32 +1,34 @@
-from typing import List, Dict, Any
-from langchain.schema import Document
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_community.chat_models import ChatOpenAI
-from langchain_community.vectorstores import Chroma
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
-from langchain_community.tools import DuckDuckGoSearchRun
-import os
+from typing import List, Dict, Any, Optional
+from langchain_core.documents import Document
+import time
 from datetime import datetime
-from dotenv import load_dotenv
-import streamlit as st
+from core.embedding_backends import DEFAULT_EMBEDDING_BACKEND, get_embedding_backend, fit_embedding_backend
+from core.chat_backends import get_chat_model, CHAT_MODEL, SUMMARY_MODEL
+from core import metrics
+from core.web_search import get_web_search
+from core.keyword_index import get_keyword_index, reciprocal_rank_fusion
 
-load_dotenv()
+# Chroma, the LangChain chains, the chat memory and streamlit are imported
+# inside the functions that use them, so importing this module stays cheap
+# and doesn't require any credentials until a backend is actually used.
 
-required_vars = ['OPENAI_API_KEY', 'REDDIT_CLIENT_ID', 'REDDIT_CLIENT_SECRET', 'REDDIT_USER_AGENT']
-missing_vars = [var for var in required_vars if not os.getenv(var)]
-if missing_vars:
-    raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
+FOLD_FETCH_MULTIPLIER = 4
+CHAT_MEMORY_MODES = ("rolling", "buffer")
+RETRIEVAL_MODES = ("hybrid", "dense", "keyword")
+DEFAULT_RETRIEVAL_MODE = "hybrid"
+# Below this best-match relevance the web search starts alongside the chain.
+LOW_RETRIEVAL_SCORE = 0.5
+UNCERTAINTY_PHRASES = (
+    "i don't know",
+    "not sure",
+    "don't have enough information",
+    "cannot answer",
+    "unable to find",
+    "no information available"
+)
 
 def duckduckgo_search(query: str) -> str:
-    try:
-        search = DuckDuckGoSearchRun()
-        return search.run(query)
-    except Exception as e:
-        print(f"Error performing web search: {str(e)}")
-        return "Sorry, I couldn't perform a web search at this time."
+    return get_web_search().search(query)
 
 def clean_metadata(metadata: dict) -> dict:
     if not isinstance(metadata, dict):
@@ -53,7 +55,9 @@ def create_documents(texts, metadatas=None):
 def create_vector_store(documents):
     if not documents:
         raise ValueError("No documents provided to create vector store")
-    embeddings = OpenAIEmbeddings()
+    from langchain_community.vectorstores import Chroma
+    from core.embedding_cache import get_cached_embeddings
+    embeddings = get_cached_embeddings()
     filtered_documents = []
     for doc in documents:
         if not isinstance(doc, Document):
@@ -65,62 +69,238 @@ def create_vector_store(documents):
         ))
     if not filtered_documents:
         raise ValueError("No valid documents after filtering")
-    return Chroma.from_documents(documents=filtered_documents, embedding=embeddings)
-
-def get_similar_chunks(vector_store, query, k=5):
-    return vector_store.similarity_search(query, k=k)
+    with metrics.span("create_vector_store"):
+        vector_store = Chroma.from_documents(documents=filtered_documents, embedding=embeddings)
+    with metrics.span("index"):
+        get_keyword_index(vector_store)
+    return vector_store
 
-def create_conversation_chain(vector_store):
-    llm = ChatOpenAI(
-        temperature=0.7,
-        model_name="gpt-4o"
+def _dense_ranking(vector_store, query: str, fetch_k: int) -> tuple:
+    query_embedding = vector_store.embeddings.embed_query(query)
+    results = vector_store._collection.query(
+        query_embeddings=[query_embedding], n_results=fetch_k, include=['documents', 'metadatas']
     )
+    ids = results['ids'][0] if results['ids'] else []
+    documents = {
+        doc_id: Document(page_content=text, metadata=metadata or {})
+        for doc_id, text, metadata in zip(ids, results['documents'][0], results['metadatas'][0])
+    } if ids else {}
+    return ids, documents
+
+def _load_documents(vector_store, ids: List[str]) -> Dict[str, Document]:
+    if not ids:
+        return {}
+    results = vector_store._collection.get(ids=ids, include=['documents', 'metadatas'])
+    return {
+        doc_id: Document(page_content=text, metadata=metadata or {})
+        for doc_id, text, metadata in zip(results['ids'], results['documents'], results['metadatas'])
+    }
+
+def get_similar_chunks(vector_store, query, k=5, mode: str = DEFAULT_RETRIEVAL_MODE, timings: dict = None):
+    # "hybrid" fuses the dense ranking with BM25 over the local keyword index
+    # by reciprocal rank; "keyword" skips the query embedding call entirely.
+    from core.chunking import fold_to_parents
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    fetch_k = k * FOLD_FETCH_MULTIPLIER
+    rankings = []
+    documents = {}
+    latency = {"mode": mode}
+    with metrics.span("retrieval"):
+        if mode in ("hybrid", "dense"):
+            started = time.perf_counter()
+            with metrics.span("retrieval_dense"):
+                dense_ids, documents = _dense_ranking(vector_store, query, fetch_k)
+            latency["dense_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            rankings.append(dense_ids)
+        if mode in ("hybrid", "keyword"):
+            started = time.perf_counter()
+            with metrics.span("retrieval_keyword"):
+                keyword_ids = [doc_id for doc_id, _ in get_keyword_index(vector_store).search(query, fetch_k)]
+            latency["keyword_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            rankings.append(keyword_ids)
+        ranked_ids = reciprocal_rank_fusion(rankings)[:fetch_k] if len(rankings) > 1 else rankings[0]
+        documents.update(_load_documents(vector_store, [doc_id for doc_id in ranked_ids if doc_id not in documents]))
+        chunks = [documents[doc_id] for doc_id in ranked_ids if doc_id in documents]
+    metrics.log_event("retrieval", **latency, results=len(chunks))
+    if timings is not None:
+        timings.update(latency)
+    return fold_to_parents(chunks, k)
+
+def create_conversation_chain(vector_store, memory_mode: str = "rolling", retrieval_mode: str = DEFAULT_RETRIEVAL_MODE):
+    from langchain_core.prompts import PromptTemplate
+    from langchain.chains import ConversationalRetrievalChain
+    from core.retrieval import ParentFoldingRetriever
+    llm = get_chat_model(CHAT_MODEL, temperature=0.7)
     prompt_template = PromptTemplate(
         input_variables=["chat_history", "question", "context"],
         template="""You are a helpful AI assistant analyzing social media trends. Use the following pieces of context to answer the question at the end. \
         If you don't know the answer, just say that you don't know, don't try to make up an answer.\n\n        Context: {context}\n\n        Chat History: {chat_history}\n        Human: {question}\n        Assistant:"""
     )
-    memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        return_messages=True
-    )
+    if memory_mode == "rolling":
+        from core.chat_memory import RollingSummaryMemory
+        memory = RollingSummaryMemory(
+            llm=get_chat_model(SUMMARY_MODEL, temperature=0),
+            memory_key="chat_history",
+            output_key="answer",
+            return_messages=True
+        )
+    elif memory_mode == "buffer":
+        from langchain.memory import ConversationBufferMemory
+        memory = ConversationBufferMemory(
+            memory_key="chat_history",
+            return_messages=True
+        )
+    else:
+        raise ValueError(f"Unknown chat memory mode: {memory_mode}")
     return ConversationalRetrievalChain.from_llm(
         llm=llm,
-        retriever=vector_store.as_retriever(),
+        retriever=ParentFoldingRetriever(vector_store=vector_store, mode=retrieval_mode),
         memory=memory,
         combine_docs_chain_kwargs={"prompt": prompt_template}
     )
 
-def process_and_store_texts(texts, metadata=None):
-    if texts and isinstance(texts[0], tuple):
-        contents, metadatas = zip(*texts)
+def retrieval_confidence(vector_store, query: str) -> float:
+    # Cosine similarity of the best chunk. Collections use Chroma's default
+    # squared-L2 space and the embeddings are unit length, so cos = 1 - d / 2.
+    try:
+        with metrics.span("retrieval_confidence"):
+            query_embedding = vector_store.embeddings.embed_query(query)
+            results = vector_store._collection.query(
+                query_embeddings=[query_embedding], n_results=1, include=['distances']
+            )
+        distances = results['distances'][0] if results['distances'] else []
+        return 1.0 - distances[0] / 2 if distances else 0.0
+    except Exception as e:
+        print(f"Error scoring retrieval: {str(e)}")
+        return 0.0
+
+def standalone_question(conversation_chain, question: str) -> Optional[str]:
+    # Rewrites a follow-up ("tell me more about that") into a question that
+    # reads the same without the conversation, so answers can be cached and
+    # shared by the question itself. None if the rewrite failed.
+    from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+    from langchain_core.messages import get_buffer_string
+    from core.tokens import count_tokens
+    memory = getattr(conversation_chain, "memory", None)
+    history = memory.load_memory_variables({}).get(memory.memory_key) if memory is not None else None
+    if not history:
+        return question
+    prompt = CONDENSE_QUESTION_PROMPT.format(
+        chat_history=history if isinstance(history, str) else get_buffer_string(history), question=question
+    )
+    try:
+        with metrics.span("condense_question"):
+            standalone = get_chat_model(SUMMARY_MODEL, temperature=0).invoke(prompt).content.strip()
+        metrics.external_call("llm", tokens_in=count_tokens(prompt), tokens_out=count_tokens(standalone))
+        return standalone or None
+    except Exception as e:
+        print(f"Error condensing question: {str(e)}")
+        return None
+
+def answer_question(conversation_chain, vector_store, question: str, web_search=None, callbacks=None) -> dict:
+    # When retrieval looks weak, the web search runs while the chain answers,
+    # so a fallback is ready as soon as the chain admits it doesn't know.
+    from core.chat_memory import PromptSizeCallback
+    web_search = web_search or get_web_search()
+    prompt_sizes = PromptSizeCallback()
+    retriever = getattr(conversation_chain, "retriever", None)
+    if vector_store is None:
+        confidence = 0.0
+    elif getattr(retriever, "mode", None) == "keyword":
+        # Keep the keyword path free of embedding calls: any BM25 hit counts as confident.
+        confidence = 1.0 if get_keyword_index(vector_store).search(question, 1) else 0.0
     else:
-        contents = texts
-        metadatas = [metadata] * len(texts)
-    documents = create_documents(contents, metadatas)
-    vector_store = create_vector_store(documents)
-    llm = ChatOpenAI(temperature=0.7, model_name="gpt-4o")
-    insights_prompt = PromptTemplate(
-        input_variables=["text"],
-        template="""Analyze the following text and provide 5 key insights about the topic. Each insight should be concise, meaningful, and highlight important trends or patterns:\n        {text}\n\n        Format the response as a list of bullet points, with each point on a new line starting with a dash (-). Focus on extracting meaningful insights rather than just summarizing the content."""
+        confidence = retrieval_confidence(vector_store, question)
+    speculative = web_search.search_async(question) if confidence < LOW_RETRIEVAL_SCORE else None
+    response = conversation_chain({"question": question}, callbacks=[prompt_sizes] + list(callbacks or []))
+    used_web = any(phrase in response["answer"].strip().lower() for phrase in UNCERTAINTY_PHRASES)
+    if used_web:
+        web_answer = (speculative or web_search.search_async(question)).result()
+        answer = f"Based on web search:\n\n{web_answer}"
+    else:
+        answer = response["answer"]
+    return {
+        "answer": answer,
+        "response": response,
+        "used_web": used_web,
+        "speculative": speculative is not None,
+        "confidence": confidence,
+        "prompt_tokens": sum(prompt_sizes.prompt_tokens),
+        "retrieval": dict(getattr(retriever, "last_timings", None) or {})
+    }
+
+def _store_duplicate_counts(vector_store, representatives):
+    # Duplicates of a post can arrive after it was indexed, so write the
+    # final counts back to all of its chunks once the stream is exhausted.
+    counts = {
+        str(metadata["id"]): metadata["duplicate_count"]
+        for _, metadata in representatives if metadata.get("duplicate_count") and metadata.get("id")
+    }
+    if not counts:
+        return
+    chunks = vector_store._collection.get(where={"parent_id": {"$in": list(counts)}}, include=['metadatas'])
+    if not chunks['ids']:
+        return
+    metadatas = []
+    for metadata in chunks['metadatas']:
+        metadatas.append({**metadata, "duplicate_count": counts[metadata["parent_id"]]})
+    vector_store._collection.update(ids=chunks['ids'], metadatas=metadatas)
+
+def process_and_store_texts(texts, metadata=None, stats=None, embedding_backend=DEFAULT_EMBEDDING_BACKEND,
+                            corpus_view: Optional[dict] = None):
+    # texts may be a list or a generator of posts; the pipeline embeds and
+    # indexes batches while the source is still producing them. With a
+    # corpus_view ({"topic", "start_date", "end_date"}) posts are upserted
+    # into the shared corpus and the returned store is that filtered view.
+    from core.embedding_cache import get_cached_embeddings
+    from core.insights import generate_insights, attribute_insights
+    from core.pipeline import stream_into_vector_store
+    from core.dedup import NearDuplicateFilter
+    from core.chunking import chunk_posts
+    from core.corpus_index import get_corpus_view, shares_vector_space
+    from core.trend_signals import TermSignalsBuilder
+    backend = get_embedding_backend(embedding_backend)
+    if isinstance(texts, list):
+        # Backends that can be fit (e.g. local TF-IDF) only see the corpus up front when it is a list.
+        backend = fit_embedding_backend(backend, [text[0] if isinstance(text, tuple) else text for text in texts])
+    if corpus_view and not shares_vector_space(backend):
+        corpus_view = None
+    embeddings = get_cached_embeddings(backend)
+    near_duplicates = NearDuplicateFilter()
+    # Term counts for the word cloud and bursts are taken once per post here,
+    # not later from overlapping chunks.
+    term_signals = TermSignalsBuilder()
+    vector_store = get_corpus_view(embeddings, **corpus_view) if corpus_view else None
+    vector_store, documents = stream_into_vector_store(
+        chunk_posts(term_signals.observe(near_duplicates.filter(texts, metadata))), embeddings, clean_metadata=clean_metadata,
+        vector_store=vector_store
     )
-    insights_chain = LLMChain(llm=llm, prompt=insights_prompt)
+    dedup_stats = near_duplicates.stats
+    metrics.record_duration("dedup", dedup_stats["seconds"])
+    metrics.increment("dedup_posts_total", dedup_stats["kept"], result="kept")
+    metrics.increment("dedup_posts_total", dedup_stats["duplicates"], result="duplicate")
+    if stats is not None:
+        stats["dedup"] = dict(dedup_stats)
+    if not documents:
+        raise ValueError("No documents provided to create vector store")
+    with metrics.span("index"):
+        _store_duplicate_counts(vector_store, near_duplicates.representatives)
+    with metrics.span("term_signals"):
+        signals = term_signals.build()
     try:
-        combined_text = "\n".join([doc.page_content for doc in documents])
-        insights = insights_chain.run(text=combined_text)
-        insights_list = [point.strip('- ').strip() for point in insights.split('\n') if point.strip()]
-        insight_sources = []
-        for insight in insights_list:
-            similar_doc = vector_store.similarity_search(insight, k=1)[0]
-            url = similar_doc.metadata.get("url", "")
-            insight_sources.append(url)
+        with metrics.span("insights"):
+            insights_list = generate_insights([doc.page_content for doc in documents])
+        with metrics.span("attribution"):
+            insight_sources = attribute_insights(insights_list, vector_store, embeddings)
         conversation_chain = create_conversation_chain(vector_store)
-        return vector_store, insights_list, conversation_chain, insight_sources
+        return vector_store, insights_list, conversation_chain, insight_sources, signals
     except Exception as e:
         print(f"Error generating insights: {str(e)}")
-        return vector_store, ["Error generating insights."], None, []
+        return vector_store, ["Error generating insights."], None, [], signals
 
 def display_chat_history(history):
+    import streamlit as st
     i = 0
     while i < len(history):
         if history[i]["role"] == "user":
@@ -0,0 +1,41 @@
+from functools import lru_cache
+from typing import List
+
+# Rough characters-per-token ratio used when tiktoken is unavailable.
+CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    # Loaded on first use; get_encoding may download the BPE file.
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def count_tokens(text: str) -> int:
+    _encoding = _get_encoding()
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    _encoding = _get_encoding()
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+def split_by_tokens(text: str, max_tokens: int, overlap: int = 0) -> List[str]:
+    step = max(1, max_tokens - overlap)
+    _encoding = _get_encoding()
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return [text]
+        return [_encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens) - overlap, step)]
+    size = max_tokens * CHARS_PER_TOKEN
+    stride = step * CHARS_PER_TOKEN
+    if len(text) <= size:
+        return [text]
+    return [text[i:i + size] for i in range(0, len(text) - overlap * CHARS_PER_TOKEN, stride)]
@@ -2,118 +2,210 @@ import hashlib
 import json
 from pathlib import Path
 from datetime import datetime
-from langchain.schema import Document
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OpenAIEmbeddings
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+from typing import Optional
+import numpy as np
+from core.embedding_backends import DEFAULT_EMBEDDING_BACKEND
+from core.cache_store import get_cache_store
+from core.keyword_index import index_documents
+from core import metrics
 import io
 import base64
 import re
+from collections import OrderedDict
 
 CACHE_DIR = Path("data/.cache")
 CACHE_DIR.mkdir(exist_ok=True)
+CACHE_LOAD_BATCH_SIZE = 5000
+OPEN_WINDOW_CACHE_TTL = 60 * 60
+CLOSED_WINDOW_CACHE_TTL = 30 * 24 * 60 * 60
+WORDCLOUD_CACHE_DIR = CACHE_DIR / "wordclouds"
+WORDCLOUD_MEMORY_CACHE_SIZE = 32
+WORDCLOUD_CACHE_MAX_BYTES = 64 * 1024 * 1024
+WORDCLOUD_PARAMS = {
+    "width": 600,
+    "height": 300,
+    "background_color": '#18191a',
+    "max_words": 200,
+    "contour_width": 2,
+    "contour_color": 'steelblue',
+    "colormap": 'tab20',
+    "prefer_horizontal": 0.7,
+    "min_font_size": 10,
+    "max_font_size": 90,
+    "random_state": 42,
+    "scale": 2,
+    "margin": 2
+}
 
-def get_cache_key(topic: str, source: str, start_date: datetime, end_date: datetime) -> str:
-    key_str = f"{topic}_{source}_{start_date}_{end_date}"
+_wordcloud_cache = OrderedDict()
+
+def get_cache_key(topic: str, source: str, start_date: datetime, end_date: datetime,
+                  embedding_backend: str = DEFAULT_EMBEDDING_BACKEND) -> str:
+    key_str = f"{topic}_{source}_{start_date}_{end_date}_{embedding_backend}"
     return hashlib.md5(key_str.encode()).hexdigest()
 
+def get_cache_ttl(end_date) -> float:
+    # Windows that reach today still change as new posts arrive.
+    if end_date is None or end_date >= datetime.utcnow().date():
+        return OPEN_WINDOW_CACHE_TTL
+    return CLOSED_WINDOW_CACHE_TTL
+
+def get_cached_insights(cache_key: str) -> Optional[dict]:
+    # Reads only the summary (insights, sources, post count), skipping the
+    # documents and vectors, for callers that don't need a vector store.
+    with metrics.span("cache_read"):
+        summary = get_cache_store().get_summary(cache_key)
+    metrics.cache_lookup("analysis", summary is not None)
+    return summary
+
 def get_cached_results(cache_key: str) -> tuple:
-    cache_file = CACHE_DIR / f"{cache_key}.json"
-    if not cache_file.exists():
-        return None
+    with metrics.span("cache_read"):
+        results = _load_cached_results(cache_key)
+    metrics.cache_lookup("analysis", results is not None)
+    return results
+
+def _load_cached_results(cache_key: str) -> tuple:
     try:
-        with open(cache_file, 'r') as f:
-            content = f.read().strip()
-            if not content:
-                return None
-            data = json.loads(content)
-            if not isinstance(data, dict) or 'documents' not in data:
-                return None
-            documents = []
-            for doc_data in data['documents']:
-                if isinstance(doc_data, dict) and 'content' in doc_data:
-                    documents.append(Document(
-                        page_content=doc_data['content'],
-                        metadata=doc_data.get('metadata', {})
-                    ))
-            if not documents:
-                return None
-            embeddings = OpenAIEmbeddings()
-            vector_store = Chroma.from_documents(
-                documents=documents,
-                embedding=embeddings,
-                collection_name=f"cached_{cache_key}"
-            )
-            return (
-                vector_store,
-                data.get('summary', ''),
-                data.get('conversation_chain', None)
+        entry = get_cache_store().get(cache_key)
+        if entry is None:
+            return None
+        summary, documents, vectors = entry
+        if not documents or vectors.shape[0] != len(documents):
+            raise ValueError(f"Embedding matrix shape {vectors.shape} does not match {len(documents)} documents")
+        ids = [doc_data['id'] for doc_data in documents]
+        texts = [doc_data['content'] for doc_data in documents]
+        metadatas = [doc_data.get('metadata') or None for doc_data in documents]
+        from core.embedding_cache import get_cached_embeddings
+        from core.embedding_backends import restore_embedding_backend
+        embeddings = get_cached_embeddings(restore_embedding_backend(summary.get('embedding_model')))
+        if summary.get('corpus_view'):
+            from core.corpus_index import get_corpus_view
+            vector_store = get_corpus_view(embeddings, **summary['corpus_view'])
+            # Only entries missing from the view (compacted away, or from
+            # another install) are written back to the shared corpus.
+            present = set(vector_store._collection.get(ids=ids, include=[])['ids'])
+            missing = [i for i, doc_id in enumerate(ids) if doc_id not in present]
+            vector_store._collection.touch(list(present))
+        else:
+            from langchain_community.vectorstores import Chroma
+            vector_store = Chroma(collection_name=f"cached_{cache_key}", embedding_function=embeddings)
+            missing = list(range(len(ids)))
+        for start in range(0, len(missing), CACHE_LOAD_BATCH_SIZE):
+            rows = missing[start:start + CACHE_LOAD_BATCH_SIZE]
+            vector_store._collection.upsert(
+                ids=[ids[i] for i in rows],
+                embeddings=vectors[rows],
+                documents=[texts[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows]
             )
-    except (json.JSONDecodeError, KeyError, Exception) as e:
-        print(f"Error reading cache file: {str(e)}")
-        try:
-            cache_file.unlink()
-        except:
-            pass
+            index_documents(vector_store, [ids[i] for i in rows], [texts[i] for i in rows])
+        term_signals = None
+        if summary.get('term_signals'):
+            from core.trend_signals import TermSignals
+            term_signals = TermSignals.from_dict(summary['term_signals'])
+        return (
+            vector_store,
+            summary.get('summary', ''),
+            None,
+            summary.get('sources', []),
+            term_signals
+        )
+    except Exception as e:
+        print(f"Error reading cache entry: {str(e)}")
+        get_cache_store().delete(cache_key)
         return None
 
-def cache_results(cache_key: str, vector_store, summary, conversation_chain):
-    cache_file = CACHE_DIR / f"{cache_key}.json"
-    try:
-        documents = []
-        store_data = vector_store.get()
-        if not store_data or 'documents' not in store_data:
-            return
-        for doc in store_data['documents']:
-            if hasattr(doc, 'page_content'):
+def cache_results(cache_key: str, vector_store, summary, conversation_chain, sources=None,
+                  topic: Optional[str] = None, ttl: Optional[float] = None, term_signals=None):
+    with metrics.span("cache_write"):
+        try:
+            store_data = vector_store.get(include=['documents', 'metadatas', 'embeddings'])
+            if not store_data or not store_data.get('documents'):
+                return
+            metadatas = store_data.get('metadatas') or [{}] * len(store_data['documents'])
+            documents = []
+            for doc_id, text, metadata in zip(store_data['ids'], store_data['documents'], metadatas):
                 documents.append({
-                    'content': doc.page_content,
-                    'metadata': doc.metadata if hasattr(doc, 'metadata') else {}
+                    'id': doc_id,
+                    'content': text,
+                    'metadata': metadata or {}
                 })
-        if not documents:
-            return
-        cache_data = {
-            'documents': documents,
-            'summary': summary,
-            'conversation_chain': conversation_chain
-        }
-        temp_file = cache_file.with_suffix('.tmp')
-        with open(temp_file, 'w') as f:
-            json.dump(cache_data, f)
-        temp_file.rename(cache_file)
-    except Exception as e:
-        print(f"Error caching results: {str(e)}")
+            vectors = np.asarray(store_data['embeddings'], dtype=np.float32)
+            if vectors.ndim != 2 or vectors.shape[0] != len(documents):
+                return
+            cache_summary = {
+                'summary': summary,
+                'sources': sources or [],
+                'post_count': len(documents),
+                'embedding_model': getattr(vector_store.embeddings, 'model_name', None),
+                'corpus_view': getattr(vector_store, 'spec', None),
+                'term_signals': term_signals.to_dict() if term_signals is not None else None
+            }
+            get_cache_store().put(cache_key, cache_summary, documents, vectors, topic=topic, ttl=ttl)
+        except Exception as e:
+            print(f"Error caching results: {str(e)}")
+
+def _wordcloud_cache_key(text_or_frequencies, params: dict) -> str:
+    if isinstance(text_or_frequencies, dict):
+        text_or_frequencies = json.dumps(text_or_frequencies, sort_keys=True)
+    key_str = json.dumps(params, sort_keys=True) + "\0" + text_or_frequencies
+    return hashlib.sha256(key_str.encode()).hexdigest()
+
+def _evict_wordclouds(max_bytes: int = WORDCLOUD_CACHE_MAX_BYTES):
+    # Disk hits touch their file, so mtime order is LRU order.
+    files = []
+    for path in WORDCLOUD_CACHE_DIR.glob("*.png"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files, key=lambda item: item[0]):
+        if total <= max_bytes:
+            break
         try:
-            temp_file.unlink()
-        except:
+            path.unlink()
+        except FileNotFoundError:
             pass
+        total -= size
 
-def generate_wordcloud(text):
-    wordcloud = WordCloud(
-        width=600,                
-        height=300,               
-        background_color='#18191a', 
-        max_words=200,
-        contour_width=2,
-        contour_color='steelblue',
-        colormap='tab20',         
-        prefer_horizontal=0.7,
-        min_font_size=10,
-        max_font_size=90,
-        random_state=42,
-        scale=2,
-        margin=2
-    ).generate(text)
-    plt.figure(figsize=(6, 3), dpi=150) 
-    plt.imshow(wordcloud, interpolation='bilinear')
-    plt.axis('off')
-    plt.tight_layout(pad=0)
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0, dpi=150)
-    buf.seek(0)
-    img_str = base64.b64encode(buf.read()).decode()
-    plt.close()
+def generate_wordcloud(text_or_frequencies, **overrides):
+    params = {**WORDCLOUD_PARAMS, **overrides}
+    cache_key = _wordcloud_cache_key(text_or_frequencies, params)
+    if cache_key in _wordcloud_cache:
+        _wordcloud_cache.move_to_end(cache_key)
+        metrics.cache_lookup("wordcloud", True)
+        return _wordcloud_cache[cache_key]
+    cache_file = WORDCLOUD_CACHE_DIR / f"{cache_key}.png"
+    metrics.cache_lookup("wordcloud", cache_file.exists())
+    if cache_file.exists():
+        png = cache_file.read_bytes()
+        cache_file.touch()
+    else:
+        with metrics.span("wordcloud"):
+            from wordcloud import WordCloud
+            wordcloud = WordCloud(**params)
+            if isinstance(text_or_frequencies, dict):
+                wordcloud.generate_from_frequencies(text_or_frequencies)
+            else:
+                wordcloud.generate(text_or_frequencies)
+            image = wordcloud.to_image()
+            buf = io.BytesIO()
+            image.save(buf, format='PNG')
+            png = buf.getvalue()
+        try:
+            WORDCLOUD_CACHE_DIR.mkdir(exist_ok=True)
+            temp_file = cache_file.with_suffix('.tmp')
+            temp_file.write_bytes(png)
+            temp_file.rename(cache_file)
+            _evict_wordclouds()
+        except Exception as e:
+            print(f"Error caching word cloud: {str(e)}")
+    img_str = base64.b64encode(png).decode()
+    _wordcloud_cache[cache_key] = img_str
+    if len(_wordcloud_cache) > WORDCLOUD_MEMORY_CACHE_SIZE:
+        _wordcloud_cache.popitem(last=False)
     return img_str
 
 def format_key_insights(insights, sources=None):
@@ -127,10 +219,19 @@ def format_key_insights(insights, sources=None):
     if sources is None:
         sources = [None] * len(points)
     bold_pattern = re.compile(r'\*\*(.*?)\*\*')
-    for point, url in zip(points, sources):
+    for point, point_sources in zip(points, sources):
         html_point = bold_pattern.sub(r'<strong>\1</strong>', point)
-        if url:
-            items.append(f'<li>{html_point} <a href="{url}" target="_blank" style="color:#1a73e8;">[source]</a></li>')
+        if isinstance(point_sources, str):
+            point_sources = [{"url": point_sources}] if point_sources else []
+        links = []
+        for n, source in enumerate(point_sources or [], start=1):
+            if not source.get("url"):
+                continue
+            label = "[source]" if len(point_sources) == 1 else f"[{n}]"
+            title = f' title="similarity {source["score"]:.2f}"' if "score" in source else ""
+            links.append(f'<a href="{source["url"]}" target="_blank"{title} style="color:#1a73e8;">{label}</a>')
+        if links:
+            items.append(f'<li>{html_point} {" ".join(links)}</li>')
         else:
             items.append(f'<li>{html_point}</li>')
     return '<ul>' + ''.join(items) + '</ul>' 
\ No newline at end of file
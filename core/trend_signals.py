@@ -0,0 +1,179 @@
+import re
+from array import array
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9'+#$.-]*[a-z0-9+#]|[a-z0-9]")
+BASELINE_DAYS = 7
+MIN_BURST_COUNT = 3
+MIN_TERM_COUNT = 2
+MAX_SIGNAL_DAYS = 90
+
+@lru_cache(maxsize=1)
+def _stopwords() -> frozenset:
+    # wordcloud pulls in matplotlib, so only import it once terms are counted.
+    from wordcloud import STOPWORDS
+    return frozenset(STOPWORDS)
+
+def tokenize(text: str) -> List[str]:
+    stopwords = _stopwords()
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in stopwords and len(token) > 1]
+
+def _post_day(metadata: Optional[dict]) -> Optional[date]:
+    created_utc = (metadata or {}).get("created_utc")
+    if created_utc is None:
+        return None
+    return datetime.utcfromtimestamp(float(created_utc)).date()
+
+class TermSignals:
+    # counts is a day x term matrix over every calendar day from the first to
+    # the last dated post, with zeros for days without posts. other_counts
+    # holds terms from posts that aren't on the day axis (undated, or more
+    # than MAX_SIGNAL_DAYS before the newest post): they count towards
+    # frequencies but never towards bursts.
+    def __init__(self, days: List[str], vocab: List[str], counts: np.ndarray,
+                 other_counts: Optional[np.ndarray] = None):
+        self.days = days
+        self.vocab = vocab
+        self.counts = counts
+        self.other_counts = other_counts if other_counts is not None else np.zeros(len(vocab), dtype=np.int32)
+        self.index = {term: i for i, term in enumerate(vocab)}
+
+    @property
+    def totals(self) -> np.ndarray:
+        return self.counts.sum(axis=0) + self.other_counts
+
+    def frequencies(self, max_terms: int = 200) -> Dict[str, int]:
+        totals = self.totals
+        if totals.size == 0:
+            return {}
+        top = np.argsort(-totals, kind="stable")[:max_terms]
+        return {self.vocab[i]: int(totals[i]) for i in top if totals[i] > 0}
+
+    def burst_scores(self, baseline_days: int = BASELINE_DAYS) -> np.ndarray:
+        # Z-score of each day's term rate against the preceding baseline window.
+        day_totals = self.counts.sum(axis=1, keepdims=True).astype(np.float64)
+        day_totals[day_totals == 0] = 1.0
+        rates = self.counts / day_totals
+        scores = np.zeros_like(rates)
+        for d in range(len(self.days)):
+            baseline = rates[max(0, d - baseline_days):d]
+            if baseline.shape[0] < 2:
+                continue
+            mean = baseline.mean(axis=0)
+            std = baseline.std(axis=0)
+            # Floor the spread so terms that were flat at zero don't divide by zero.
+            floor = 1.0 / day_totals[d, 0]
+            scores[d] = (rates[d] - mean) / np.maximum(std, floor)
+        return scores
+
+    def top_bursts(self, day: Optional[str] = None, k: int = 10, baseline_days: int = BASELINE_DAYS,
+                   min_count: int = MIN_BURST_COUNT) -> List[dict]:
+        if not self.days:
+            return []
+        d = self.days.index(day) if day else len(self.days) - 1
+        scores = self.burst_scores(baseline_days)[d]
+        eligible = np.where(self.counts[d] >= min_count, scores, -np.inf)
+        top = np.argsort(-eligible, kind="stable")[:k]
+        return [
+            {"term": self.vocab[i], "day": self.days[d], "count": int(self.counts[d, i]), "z": float(scores[i])}
+            for i in top if np.isfinite(eligible[i]) and scores[i] > 0
+        ]
+
+    def to_dict(self) -> dict:
+        # Sparse form for the analysis cache; most day x term cells are zero.
+        day_ids, term_ids = np.nonzero(self.counts)
+        other_ids = np.flatnonzero(self.other_counts)
+        return {
+            "days": self.days,
+            "vocab": self.vocab,
+            "cells": [day_ids.tolist(), term_ids.tolist(), self.counts[day_ids, term_ids].tolist()],
+            "other": [other_ids.tolist(), self.other_counts[other_ids].tolist()]
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TermSignals":
+        days, vocab = data["days"], data["vocab"]
+        counts = np.zeros((len(days), len(vocab)), dtype=np.int32)
+        day_ids, term_ids, values = data["cells"]
+        counts[np.asarray(day_ids, dtype=np.int64), np.asarray(term_ids, dtype=np.int64)] = values
+        other_counts = np.zeros(len(vocab), dtype=np.int32)
+        other_ids, other_values = data["other"]
+        other_counts[np.asarray(other_ids, dtype=np.int64)] = other_values
+        return cls(days, vocab, counts, other_counts)
+
+class TermSignalsBuilder:
+    # Counts terms once per post as posts stream through ingestion, keeping
+    # only integer token ids until build().
+    def __init__(self):
+        self.vocab = {}
+        self.day_index = {}
+        self.token_ids = array('I')
+        self.post_days = array('I')
+        self.post_lengths = array('I')
+
+    def add(self, text: str, metadata: Optional[dict] = None):
+        self.post_days.append(self.day_index.setdefault(_post_day(metadata), len(self.day_index)))
+        ids = [self.vocab.setdefault(token, len(self.vocab)) for token in tokenize(text or "")]
+        self.token_ids.extend(ids)
+        self.post_lengths.append(len(ids))
+
+    def observe(self, posts: Iterable[Tuple[str, dict]]) -> Iterator[Tuple[str, dict]]:
+        for content, metadata in posts:
+            self.add(content, metadata)
+            yield content, metadata
+
+    def build(self, min_term_count: int = MIN_TERM_COUNT, max_days: int = MAX_SIGNAL_DAYS) -> TermSignals:
+        dated = [day for day in self.day_index if day is not None]
+        days = []
+        if dated:
+            last = max(dated)
+            first = max(min(dated), last - timedelta(days=max_days - 1))
+            days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        positions = {day: position for position, day in enumerate(days)}
+        # Row len(days) collects posts off the day axis and is split off at the end.
+        day_order = np.empty(len(self.day_index), dtype=np.int64)
+        for day, index in self.day_index.items():
+            day_order[index] = positions.get(day, len(days))
+        rows = len(days) + 1
+        unigrams = np.frombuffer(self.token_ids, dtype=np.uint32).astype(np.int64)
+        post_lengths = np.frombuffer(self.post_lengths, dtype=np.uint32).astype(np.int64)
+        post_days = np.frombuffer(self.post_days, dtype=np.uint32).astype(np.int64)
+        token_days = np.repeat(day_order[post_days], post_lengths)
+        # Bigrams are encoded as pairs of unigram ids and never cross a post boundary.
+        vocab_size = len(self.vocab)
+        same_post = np.ones(max(len(unigrams) - 1, 0), dtype=bool)
+        boundaries = np.cumsum(post_lengths)[:-1] - 1
+        same_post[boundaries[(boundaries >= 0) & (boundaries < len(same_post))]] = False
+        pairs = (unigrams[:-1] * vocab_size + unigrams[1:])[same_post]
+        bigram_codes, bigrams = np.unique(pairs, return_inverse=True)
+        term_ids = np.concatenate([unigrams, vocab_size + bigrams.ravel()])
+        term_days = np.concatenate([token_days, token_days[:-1][same_post]])
+        # Drop rare terms before building the dense day x term matrix; with
+        # bigrams most of the vocabulary occurs only once.
+        keep = np.bincount(term_ids, minlength=vocab_size + len(bigram_codes)) >= min_term_count
+        remap = np.cumsum(keep) - 1
+        words = list(self.vocab)
+        kept_terms = [words[i] for i in np.flatnonzero(keep[:vocab_size])]
+        kept_terms += [f"{words[code // vocab_size]} {words[code % vocab_size]}" for code in bigram_codes[keep[vocab_size:]]]
+        mask = keep[term_ids]
+        flat = term_days[mask] * len(kept_terms) + remap[term_ids[mask]]
+        counts = np.bincount(flat, minlength=rows * len(kept_terms)).astype(np.int32).reshape(rows, len(kept_terms))
+        return TermSignals([day.isoformat() for day in days], kept_terms, counts[:-1], counts[-1])
+
+def build_term_signals(texts: List[str], metadatas: Optional[List[dict]] = None,
+                       min_term_count: int = MIN_TERM_COUNT) -> TermSignals:
+    builder = TermSignalsBuilder()
+    for i, text in enumerate(texts):
+        builder.add(text, metadatas[i] if metadatas and i < len(metadatas) else None)
+    return builder.build(min_term_count)
+
+def build_term_signals_from_store(vector_store) -> TermSignals:
+    # For cached analyses from before signals were counted at ingestion; it
+    # counts stored chunks, so text in chunk overlaps is counted twice.
+    store_data = vector_store.get(include=['documents', 'metadatas'])
+    if not store_data or not store_data.get('documents'):
+        return TermSignals([], [], np.zeros((0, 0), dtype=np.int32))
+    return build_term_signals(store_data['documents'], store_data.get('metadatas'))
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+from core.answer_cache import normalize_question
+from core import metrics
+
+WEB_SEARCH_TTL = 15 * 60
+WEB_SEARCH_CACHE_SIZE = 256
+WEB_SEARCH_WORKERS = 4
+WEB_SEARCH_ERROR = "Sorry, I couldn't perform a web search at this time."
+
+_duckduckgo = None
+_duckduckgo_lock = threading.Lock()
+
+def duckduckgo_backend(query: str) -> str:
+    # One long-lived client for the process instead of one per question.
+    global _duckduckgo
+    with _duckduckgo_lock:
+        if _duckduckgo is None:
+            from langchain_community.tools import DuckDuckGoSearchRun
+            _duckduckgo = DuckDuckGoSearchRun()
+    return _duckduckgo.run(query)
+
+class WebSearch:
+    # TTL-cached web search keyed by the normalized question. Concurrent
+    # requests for the same question share one backend call, so a speculative
+    # search started alongside the chain is reused when the fallback needs it.
+    def __init__(self, backend: Callable[[str], str] = duckduckgo_backend, ttl: float = WEB_SEARCH_TTL,
+                 max_entries: int = WEB_SEARCH_CACHE_SIZE, max_workers: int = WEB_SEARCH_WORKERS):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+
+    def _cached(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return result
+
+    def _run(self, key: str, query: str) -> str:
+        try:
+            metrics.external_call("web_search")
+            with metrics.span("web_search"):
+                result = self.backend(query)
+        except Exception as e:
+            print(f"Error performing web search: {str(e)}")
+            with self._lock:
+                self.in_flight.pop(key, None)
+            return WEB_SEARCH_ERROR
+        with self._lock:
+            self.entries[key] = (result, time.time() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.in_flight.pop(key, None)
+        return result
+
+    def search_async(self, query: str) -> Future:
+        key = normalize_question(query)
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                metrics.cache_lookup("web_search", True)
+                future = Future()
+                future.set_result(cached)
+                return future
+            future = self.in_flight.get(key)
+            if future is not None:
+                metrics.cache_lookup("web_search", True)
+                return future
+            metrics.cache_lookup("web_search", False)
+            future = self.in_flight[key] = self._executor.submit(metrics.propagate(self._run), key, query)
+            return future
+
+    def search(self, query: str) -> str:
+        return self.search_async(query).result()
+
+_web_search = None
+_web_search_lock = threading.Lock()
+
+def get_web_search() -> WebSearch:
+    global _web_search
+    with _web_search_lock:
+        if _web_search is None:
+            _web_search = WebSearch()
+        return _web_search
+
+def set_search_backend(backend: Callable[[str], str]) -> WebSearch:
+    # Swap in another backend (e.g. a local stand-in for tests); the cache
+    # starts empty so results from different backends never mix.
+    global _web_search
+    with _web_search_lock:
+        _web_search = WebSearch(backend)
+        return _web_search
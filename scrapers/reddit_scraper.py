@@ -1,19 +1,45 @@
-import praw
-from typing import List, Optional
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Sequence, Tuple
 import os
-from dotenv import load_dotenv
-from datetime import datetime
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from core import metrics
+from core.credentials import require_credentials
 
-load_dotenv()
+if TYPE_CHECKING:
+    import praw
 
-def get_reddit_client() -> Optional[praw.Reddit]:
+REDDIT_REQUESTS_PER_MINUTE = 100
+REDDIT_PAGE_SIZE = 100
+DEFAULT_SUBREDDITS = ("all",)
+DEFAULT_SORTS = (("relevance", "all"),)
+SORTS = ("relevance", "hot", "top", "new", "comments")
+SORT_OPTIONS = ("relevance:all", "relevance:month", "top:week", "top:month", "top:all", "hot:all", "new:all",
+                "comments:all")
+TIME_FILTERS = (
+    ("hour", timedelta(hours=1)),
+    ("day", timedelta(days=1)),
+    ("week", timedelta(weeks=1)),
+    ("month", timedelta(days=31)),
+    ("year", timedelta(days=366)),
+)
+TIME_FILTER_NAMES = tuple(name for name, _ in TIME_FILTERS) + ("all",)
+
+_reddit_client = None
+_reddit_client_lock = threading.Lock()
+# One bucket for the process-wide client, so concurrent fetches share its quota.
+_rate_limiter = None
+
+def get_reddit_client() -> Optional["praw.Reddit"]:
     try:
+        require_credentials("reddit")
+        import praw
         client_id = os.getenv('REDDIT_CLIENT_ID')
         client_secret = os.getenv('REDDIT_CLIENT_SECRET')
         user_agent = os.getenv('REDDIT_USER_AGENT', 'TrendAnalyzer/1.0')
-        if not all([client_id, client_secret]):
-            print("Reddit credentials not found in environment variables")
-            return None
         return praw.Reddit(
             client_id=client_id,
             client_secret=client_secret,
@@ -23,32 +49,304 @@ def get_reddit_client() -> Optional[praw.Reddit]:
         print(f"Error initializing Reddit client: {e}")
         return None
 
-def search_reddit_posts(keyword: str, max_posts: int = 100, start_date=None, end_date=None) -> List[str]:
-    reddit = get_reddit_client()
+def get_shared_reddit_client() -> Optional["praw.Reddit"]:
+    global _reddit_client
+    with _reddit_client_lock:
+        if _reddit_client is None:
+            _reddit_client = get_reddit_client()
+        return _reddit_client
+
+def get_shared_rate_limiter() -> "TokenBucket":
+    global _rate_limiter
+    with _reddit_client_lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucket()
+        return _rate_limiter
+
+def post_in_range(post, start_date=None, end_date=None) -> bool:
+    created_date = datetime.utcfromtimestamp(post.created_utc).date()
+    if start_date and created_date < start_date:
+        return False
+    if end_date and created_date > end_date:
+        return False
+    return True
+
+def post_to_document(post) -> Tuple[str, dict]:
+    content = post.title
+    if post.selftext:
+        content += f"\n{post.selftext}"
+    metadata = {
+        "url": f"https://www.reddit.com{post.permalink}",
+        "id": post.id,
+        "subreddit": str(post.subreddit),
+        "created_utc": post.created_utc,
+    }
+    return content, metadata
+
+def _instrumented_listing(listing) -> Iterator:
+    # PRAW pages lazily, so the time spent waiting on the listing is the
+    # network time; report it and the request count per page.
+    iterator = iter(listing)
+    count = 0
+    waited = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                post = next(iterator)
+            except StopIteration:
+                if count == 0:
+                    metrics.external_call("reddit")
+                return
+            finally:
+                waited += time.perf_counter() - started
+            if count % REDDIT_PAGE_SIZE == 0:
+                metrics.external_call("reddit")
+            count += 1
+            if count % REDDIT_PAGE_SIZE == 0:
+                metrics.record_duration("reddit_page", waited)
+                waited = 0.0
+            yield post
+    finally:
+        if count % REDDIT_PAGE_SIZE or count == 0:
+            metrics.record_duration("reddit_page", waited)
+
+def _wait(seconds: float, stop_event: Optional[threading.Event] = None) -> bool:
+    # Returns True if stop_event was set while waiting.
+    if stop_event is not None:
+        return stop_event.wait(seconds)
+    time.sleep(seconds)
+    return False
+
+class TokenBucket:
+    # clock and wait can be swapped for a simulated clock, so pacing can be
+    # checked without real sleeps (see benchmarks/fakes.FakeClock).
+    def __init__(self, rate: float = REDDIT_REQUESTS_PER_MINUTE / 60, capacity: float = 10,
+                 clock: Callable[[], float] = time.monotonic,
+                 wait: Callable[[float, Optional[threading.Event]], bool] = _wait):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.paused_until = 0.0
+        self.clock = clock
+        self.wait = wait
+        self.updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event: Optional[threading.Event] = None) -> bool:
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                # Refills accumulate float error; without the slack a wait
+                # can come out too small to move the clock forward.
+                if now >= self.paused_until and self.tokens >= 1 - 1e-9:
+                    self.tokens -= 1
+                    return True
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            if self.wait(wait, stop_event):
+                return False
+
+    def update_from_limits(self, limits: Optional[dict]):
+        # PRAW exposes the last x-ratelimit-* headers as reddit.auth.limits.
+        if not limits or limits.get("remaining") is None or not limits.get("reset_timestamp"):
+            return
+        seconds_to_reset = limits["reset_timestamp"] - time.time()
+        if seconds_to_reset <= 0:
+            return
+        with self._lock:
+            if limits["remaining"] < 1:
+                self.tokens = 0
+                self.paused_until = self.clock() + seconds_to_reset
+            else:
+                self.rate = min(self.rate, limits["remaining"] / seconds_to_reset)
+
+def _limits(reddit) -> Optional[dict]:
+    try:
+        return reddit.auth.limits
+    except Exception:
+        return None
+
+def _paced_listing(listing, before_page: Callable[[], bool]) -> Iterator:
+    # PRAW requests a page when the first item of that page is pulled, so
+    # before_page runs ahead of next() at every page boundary; the listing
+    # ends if it returns False.
+    iterator = iter(listing)
+    count = 0
+    while True:
+        if count % REDDIT_PAGE_SIZE == 0 and not before_page():
+            return
+        try:
+            post = next(iterator)
+        except StopIteration:
+            return
+        count += 1
+        yield post
+
+def _search_listing(reddit, subreddit: str, keyword: str, rate_limiter: Optional[TokenBucket] = None,
+                    stop_event: Optional[threading.Event] = None, **search_kwargs) -> Iterator:
+    # Every Reddit search goes through here, so each listing page, from any
+    # thread, takes a token from the same limiter first.
+    rate_limiter = rate_limiter or get_shared_rate_limiter()
+
+    def before_page() -> bool:
+        if stop_event is not None and stop_event.is_set():
+            return False
+        rate_limiter.update_from_limits(_limits(reddit))
+        return rate_limiter.acquire(stop_event)
+
+    return _paced_listing(_instrumented_listing(reddit.subreddit(subreddit).search(keyword, **search_kwargs)), before_page)
+
+def parse_subreddits(value) -> Tuple[str, ...]:
+    # Accepts "a, b", "r/a+r/b" or a list; an empty value means r/all.
+    names = value.replace("+", ",").split(",") if isinstance(value, str) else value
+    names = (re.sub(r"^/?r/", "", name.strip()) for name in names)
+    return tuple(dict.fromkeys(name for name in names if name)) or DEFAULT_SUBREDDITS
+
+def parse_sort(value: str) -> Tuple[str, str]:
+    # "top:week" -> ("top", "week"); a bare sort searches all time.
+    sort, _, time_filter = value.strip().partition(":")
+    time_filter = time_filter or "all"
+    if sort not in SORTS or time_filter not in TIME_FILTER_NAMES:
+        raise ValueError(f"Unknown Reddit sort: {value}")
+    return sort, time_filter
+
+def tightest_time_filter(start_date, now: Optional[datetime] = None) -> str:
+    now = now or datetime.utcnow()
+    age = now - datetime.combine(start_date, datetime.min.time())
+    for time_filter, span in TIME_FILTERS:
+        if age <= span:
+            return time_filter
+    return "all"
+
+def _report_fetch(stats: dict):
+    metrics.increment("reddit_posts_total", stats.get("fetched", 0), result="fetched")
+    metrics.increment("reddit_posts_total", stats.get("kept", 0), result="kept")
+
+def iter_posts_in_window(keyword: str, start_date, end_date=None, max_posts: int = 100, reddit=None,
+                         stats: Optional[dict] = None,
+                         subreddits: Sequence[str] = DEFAULT_SUBREDDITS) -> Iterator[Tuple[str, dict]]:
+    reddit = reddit or get_shared_reddit_client()
+    stats = stats if stats is not None else {}
+    stats.update({"fetched": 0, "kept": 0, "pages": 0, "time_filter": None, "exhausted": False, "capped": False})
     if not reddit:
-        return []
-    posts = []
+        return
+    time_filter = tightest_time_filter(start_date)
+    stats["time_filter"] = time_filter
     try:
-        search_results = reddit.subreddit("all").search(keyword, limit=max_posts)
+        # Newest first, so the walk can stop at the first post older than the
+        # window; several subreddits are searched as one "a+b" listing.
+        search_results = _search_listing(
+            reddit, "+".join(subreddits), keyword, sort="new", time_filter=time_filter, limit=None
+        )
         for post in search_results:
-            if len(posts) >= max_posts:
+            stats["fetched"] += 1
+            stats["pages"] = -(-stats["fetched"] // REDDIT_PAGE_SIZE)
+            created_date = datetime.utcfromtimestamp(post.created_utc).date()
+            if created_date < start_date:
+                stats["exhausted"] = True
                 break
-            created_utc = datetime.utcfromtimestamp(post.created_utc)
-            if start_date and created_utc.date() < start_date:
+            if end_date and created_date > end_date:
                 continue
-            if end_date and created_utc.date() > end_date:
-                continue
-            content = post.title
-            if post.selftext:
-                content += f"\n{post.selftext}"
-            metadata = {
-                "url": f"https://www.reddit.com{post.permalink}",
-            }
-            posts.append((content, metadata))
-        return posts[:max_posts]
+            stats["kept"] += 1
+            yield post_to_document(post)
+            if stats["kept"] >= max_posts:
+                stats["capped"] = True
+                break
+        else:
+            stats["exhausted"] = True
     except Exception as e:
         print(f"Error searching Reddit: {e}")
-        return []
+    finally:
+        _report_fetch(stats)
+
+def fetch_posts_in_window(keyword: str, start_date, end_date=None, max_posts: int = 100,
+                          reddit=None, subreddits: Sequence[str] = DEFAULT_SUBREDDITS) -> Tuple[List[Tuple[str, dict]], dict]:
+    stats = {}
+    posts = list(iter_posts_in_window(keyword, start_date, end_date, max_posts, reddit, stats, subreddits))
+    return posts, stats
+
+def iter_reddit_posts(keyword: str, max_posts: int = 100, start_date=None, end_date=None,
+                      date_bounded: bool = False, subreddits: Sequence[str] = DEFAULT_SUBREDDITS,
+                      sorts: Sequence[Tuple[str, str]] = DEFAULT_SORTS,
+                      stats: Optional[dict] = None) -> Iterator[Tuple[str, dict]]:
+    if date_bounded and start_date:
+        return iter_posts_in_window(keyword, start_date, end_date, max_posts, stats=stats, subreddits=subreddits)
+    return stream_reddit_posts(keyword, subreddits=subreddits, sorts=sorts, max_posts=max_posts,
+                               limit_per_listing=max_posts, start_date=start_date, end_date=end_date, stats=stats)
+
+def search_reddit_posts(keyword: str, max_posts: int = 100, start_date=None, end_date=None,
+                        date_bounded: bool = False, stats: Optional[dict] = None,
+                        subreddits: Sequence[str] = DEFAULT_SUBREDDITS,
+                        sorts: Sequence[Tuple[str, str]] = DEFAULT_SORTS) -> List[Tuple[str, dict]]:
+    return list(iter_reddit_posts(keyword, max_posts, start_date, end_date, date_bounded, subreddits, sorts, stats))
+
+def _fetch_listing(reddit, keyword: str, subreddit: str, sort: str, time_filter: str, limit: Optional[int],
+                   rate_limiter: TokenBucket, results: queue.Queue, stop_event: threading.Event) -> Optional[int]:
+    # Returns how many posts the listing gave, or None if it failed.
+    count = 0
+    try:
+        listing = _search_listing(reddit, subreddit, keyword, rate_limiter, stop_event,
+                                  sort=sort, time_filter=time_filter, limit=limit)
+        for post in listing:
+            if stop_event.is_set():
+                break
+            count += 1
+            results.put(post)
+        return count
+    except Exception as e:
+        print(f"Error searching r/{subreddit} ({sort}, {time_filter}): {e}")
+        return None
+
+def stream_reddit_posts(keyword: str, subreddits: Sequence[str] = DEFAULT_SUBREDDITS,
+                        sorts: Sequence[Tuple[str, str]] = DEFAULT_SORTS, max_posts: int = 100,
+                        limit_per_listing: Optional[int] = 100, start_date=None, end_date=None, max_workers: int = 4,
+                        rate_limiter: Optional[TokenBucket] = None, reddit=None,
+                        stats: Optional[dict] = None) -> Iterator[Tuple[str, dict]]:
+    reddit = reddit or get_shared_reddit_client()
+    stats = stats if stats is not None else {}
+    stats.update({"fetched": 0, "kept": 0, "listings": 0, "exhausted": False, "capped": False})
+    if not reddit:
+        return
+    rate_limiter = rate_limiter or get_shared_rate_limiter()
+    results = queue.Queue()
+    stop_event = threading.Event()
+    done = object()
+    jobs = [(subreddit, sort, time_filter) for subreddit in subreddits for sort, time_filter in sorts]
+    stats["listings"] = len(jobs)
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs))))
+    futures = [
+        executor.submit(metrics.propagate(_fetch_listing), reddit, keyword, subreddit, sort, time_filter, limit_per_listing,
+                        rate_limiter, results, stop_event)
+        for subreddit, sort, time_filter in jobs
+    ]
+    for future in futures:
+        future.add_done_callback(lambda _: results.put(done))
+    seen_ids = set()
+    finished = 0
+    try:
+        while finished < len(futures) and stats["kept"] < max_posts:
+            post = results.get()
+            if post is done:
+                finished += 1
+                continue
+            stats["fetched"] += 1
+            if post.id in seen_ids or not post_in_range(post, start_date, end_date):
+                continue
+            seen_ids.add(post.id)
+            stats["kept"] += 1
+            yield post_to_document(post)
+        # Every listing ran out before its limit: nothing matching was left unseen.
+        counts = [future.result() for future in futures] if finished == len(futures) else [None]
+        stats["capped"] = stats["kept"] >= max_posts
+        stats["exhausted"] = not stats["capped"] and all(
+            count is not None and (limit_per_listing is None or count < limit_per_listing) for count in counts
+        )
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=False)
+        _report_fetch(stats)
 
 def format_key_insights(insights, sources):
     items = []